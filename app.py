@@ -3,11 +3,12 @@ Web Interface for Phishing Email Detector
 Flask-based web application
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, stream_with_context
 import os
+import hashlib
 from dotenv import load_dotenv
 from detector import PhishingDetector, DetectionResult
-import json
+import orjson
 
 load_dotenv()
 
@@ -17,10 +18,15 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16mb max
 # init detector
 detector = PhishingDetector()
 
-@app.route('/')
-def index():
-    """Main page"""
-    return '''
+# batch concurrent /analyze gpt calls
+if detector.config.get('micro_batching', {}).get('enabled', False):
+    detector.enable_micro_batching()
+
+def ojsonify(obj, status: int = 200) -> Response:
+    """JSON response serialized with orjson"""
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
+
+INDEX_HTML = '''
     <!DOCTYPE html>
     <html>
     <head>
@@ -274,6 +280,23 @@ def index():
     </html>
     '''
 
+# encoded once at import
+_INDEX_BYTES = INDEX_HTML.encode('utf-8')
+_INDEX_ETAG = hashlib.md5(_INDEX_BYTES).hexdigest()
+_INDEX_HEADERS = {
+    'Cache-Control': 'public, max-age=3600',
+    'ETag': f'"{_INDEX_ETAG}"'
+}
+
+@app.route('/')
+def index():
+    """Main page"""
+    # page is static, let clients revalidate with the etag
+    if _INDEX_ETAG in request.if_none_match:
+        return Response(status=304, headers=_INDEX_HEADERS)
+    return Response(_INDEX_BYTES, content_type='text/html; charset=utf-8',
+                    headers=_INDEX_HEADERS)
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
     """Analyze email endpoint"""
@@ -281,11 +304,11 @@ def analyze():
         data = request.json
         
         if not data:
-            return jsonify({'error': 'No data provided'}), 400
+            return ojsonify({'error': 'No data provided'}, 400)
             
         # basic validation
         if not data.get('sender') or not data.get('body'):
-            return jsonify({'error': 'Sender and body are required'}), 400
+            return ojsonify({'error': 'Sender and body are required'}, 400)
         
         # analyze
         result = detector.analyze_email(
@@ -295,38 +318,47 @@ def analyze():
         )
         
         # convert to dict
-        return jsonify({
+        return ojsonify({
             'score': result.score,
             'risk_level': result.risk_level,
             'threats': result.threats,
             'suspicious_urls': result.suspicious_urls,
             'recommendations': result.recommendations,
-            'timestamp': result.timestamp
+            'timestamp': result.timestamp,
+            'truncated': result.truncated
         })
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}, 500)
 
 @app.route('/batch', methods=['POST'])
 def batch_analyze():
     """Batch analysis endpoint"""
     try:
         emails = request.json.get('emails', [])
-        results = detector.batch_analyze(emails)
-        
-        # convert results
-        output = []
-        for result in results:
-            output.append({
-                'score': result.score,
-                'risk_level': result.risk_level,
-                'threats': result.threats
-            })
-        
-        return jsonify({'results': output})
-        
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}, 500)
+    
+    if not isinstance(emails, list):
+        return ojsonify({'error': 'emails must be a list'}, 400)
+    
+    def generate():
+        # stream each result as soon as its gpt chunk returns
+        yield b'{"results":['
+        try:
+            for i, result in enumerate(detector.iter_batch_analyze(emails)):
+                item = orjson.dumps({
+                    'score': result.score,
+                    'risk_level': result.risk_level,
+                    'threats': result.threats
+                })
+                yield item if i == 0 else b',' + item
+        except Exception as e:
+            # headers are already sent, log and still close the document
+            print(f"Error analyzing emails: {e}")
+        yield b']}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
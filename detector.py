@@ -4,18 +4,23 @@ Phishing Email Detector - Main Engine
 Analyzes emails for phishing attempts using GPT and pattern matching
 """
 
-import re
 import json
+import orjson
+import hashlib
 import argparse
+import asyncio
 import sys
-from datetime import datetime
-from typing import Dict, List, Tuple, Optional
+import time
+from typing import Dict, List, Tuple, Optional, Iterator
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from concurrent.futures import ThreadPoolExecutor
 import os
 from dotenv import load_dotenv
 
 from models.analyzer import GPTAnalyzer
+from models.batcher import MicroBatcher
+from models.cache import MemoryCache, RedisCache
 from models.patterns import PatternMatcher
 from models.scorer import RiskScorer
 from utils.parser import EmailParser
@@ -24,7 +29,25 @@ from utils.reporter import ReportGenerator
 
 load_dotenv()
 
-@dataclass
+# longest body prefix handed to the checks
+MAX_SCAN_CHARS = 65536
+
+_SUSPICIOUS_URL_WARNING = "⚠️ Suspicious URL detected: "
+
+# (epoch second, formatted string) of the last timestamp
+_last_timestamp = (0, '')
+
+def _timestamp() -> str:
+    """Current local time in ISO format, formatted at most once per second"""
+    global _last_timestamp
+    second = int(time.time())
+    cached_second, text = _last_timestamp
+    if second != cached_second:
+        text = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(second))
+        _last_timestamp = (second, text)
+    return text
+
+@dataclass(slots=True)
 class DetectionResult:
     """Stores phishing detection results"""
     score: int
@@ -34,35 +57,70 @@ class DetectionResult:
     analysis: Dict
     timestamp: str
     recommendations: List[str]
+    truncated: bool = False  # body exceeded MAX_SCAN_CHARS
 
 class PhishingDetector:
     """Main phishing detection engine"""
     
+    # (condition on score and urls, recommendations), checked in order
+    RECOMMENDATION_RULES = (
+        (lambda score, urls: score > 60,
+         ("Do not click any links in this email",
+          "Verify sender through official channels")),
+        (lambda score, urls: bool(urls),
+         ("Hover over links to verify destinations",)),
+        (lambda score, urls: score > 80,
+         ("Report this email to your security team",
+          "Delete this email immediately")),
+    )
+    
     def __init__(self, api_key: str = None):
+        # load config
+        self.config = self._load_config()
+        thresholds = self.config['risk_thresholds']
+        self._thresholds = (thresholds['low'], thresholds['medium'], thresholds['high'])
+        
         # init components
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
-        self.gpt_analyzer = GPTAnalyzer(self.api_key)
+        self.gpt_analyzer = GPTAnalyzer(
+            self.api_key,
+            cache=self._build_cache(),
+            timeout=self.config.get('request_timeout_seconds', 10),
+            connect_timeout=self.config.get('connect_timeout_seconds', 3),
+            max_retries=self.config.get('max_retries', 2)
+        )
         self.pattern_matcher = PatternMatcher()
         self.risk_scorer = RiskScorer()
         self.email_parser = EmailParser()
         self.url_validator = URLValidator()
         self.reporter = ReportGenerator()
         
-        # load config
-        self.config = self._load_config()
+        # set by enable_micro_batching
+        self.micro_batcher = None
         
     def _load_config(self) -> Dict:
         """Load configuration settings"""
         config_path = Path('config.json')
         if config_path.exists():
-            with open(config_path, 'r') as f:
-                return json.load(f)
+            with open(config_path, 'rb') as f:
+                return orjson.loads(f.read())
         return self._default_config()
     
+    def _build_cache(self):
+        """Create the GPT verdict cache from config"""
+        settings = self.config.get('cache_settings', {})
+        ttl = settings.get('ttl_seconds', 3600)
+        if not settings.get('enabled', True):
+            return MemoryCache(max_size=0)
+        if settings.get('backend') == 'redis':
+            # shared across worker processes
+            return RedisCache.from_url(settings.get('redis_url', 'redis://localhost:6379/0'), ttl)
+        return MemoryCache(max_size=settings.get('max_size', 1000), ttl_seconds=ttl)
+    
     def _default_config(self) -> Dict:
         """Default configuration"""
         return {
-            "model": "gpt-4",
+            "model": "gpt-4o",
             "temperature": 0.3,
             "max_tokens": 500,
             "risk_thresholds": {
@@ -73,47 +131,129 @@ class PhishingDetector:
         }
     
     def analyze_email(self, sender: str, subject: str, body: str, 
-                     headers: Dict = None) -> DetectionResult:
+                     headers: Dict = None, force_gpt: bool = False) -> DetectionResult:
         """
         Analyze email for phishing indicators
         Returns detection result with score and details
+        Set force_gpt to always ask GPT, even for obvious verdicts
+        """
+        # local checks
+        scan = self._scan_email(sender, subject, body, headers)
+        
+        # gpt analysis
+        if scan['local_verdict'] and not force_gpt:
+            # local signals are conclusive, skip the api call
+            gpt_result = scan['local_verdict']
+        elif self.micro_batcher:
+            # shares a gpt call with concurrent requests
+            gpt_result = self.micro_batcher.analyze(
+                sender=sender,
+                subject=subject,
+                body=scan['parsed']['body'],
+                timeout=self.config.get('micro_batching', {}).get('timeout_seconds', 30)
+            )
+        else:
+            gpt_result = self.gpt_analyzer.analyze(
+                sender=sender,
+                subject=subject,
+                body=scan['parsed']['body'],
+                config=self.config
+            )
+        
+        return self._build_result(scan, gpt_result)
+    
+    def enable_micro_batching(self):
+        """Group concurrent analyze_email GPT calls into batched requests"""
+        settings = self.config.get('micro_batching', {})
+        self.micro_batcher = MicroBatcher(
+            self.gpt_analyzer,
+            self.config,
+            max_batch_size=settings.get('max_batch_size', 16),
+            max_wait=settings.get('max_wait_ms', 50) / 1000,
+            workers=self.config.get('batch_processing', {}).get('parallel_workers', 4)
+        )
+    
+    def _scan_email(self, sender: str, subject: str, body: str,
+                    headers: Dict = None) -> Dict:
         """
+        Run the local (non-GPT) checks on an email
+        Returns parsed data with pattern and URL findings
+        """
+        # bound per-email work, bodies can be up to 16mb
+        truncated = len(body) > MAX_SCAN_CHARS
+        if truncated:
+            body = body[:MAX_SCAN_CHARS]
+        
         # parse email components
         parsed = self.email_parser.parse(sender, subject, body, headers)
         
-        # extract urls
-        urls = self._extract_urls(body)
-        suspicious_urls = []
+        # urls were already extracted by the parser, no second body scan
+        urls = parsed['urls']
         
-        # validate urls
-        for url in urls:
-            if self.url_validator.is_suspicious(url):
-                suspicious_urls.append(url)
+        # validate urls, each distinct url once
+        suspicious_urls = [url for url, suspicious
+                           in zip(urls, self.url_validator.is_suspicious_batch(urls))
+                           if suspicious]
         
         # pattern matching
         pattern_threats = self.pattern_matcher.check(parsed)
         
-        # gpt analysis
-        gpt_result = self.gpt_analyzer.analyze(
-            sender=sender,
-            subject=subject,
-            body=body,
-            config=self.config
+        return {
+            'parsed': parsed,
+            'suspicious_urls': suspicious_urls,
+            'pattern_threats': pattern_threats,
+            'truncated': truncated,
+            'local_verdict': self._local_verdict(parsed, pattern_threats, suspicious_urls)
+        }
+    
+    def _local_verdict(self, parsed: Dict, pattern_threats: List[str],
+                       suspicious_urls: List[str]) -> Optional[Dict]:
+        """
+        Verdict from local signals when they are conclusive
+        Returns a stand-in GPT result, or None if GPT is needed
+        """
+        settings = self.config.get('gpt_short_circuit', {})
+        if not settings.get('enabled', True):
+            return None
+        
+        estimate = self.risk_scorer.cheap_estimate(
+            len(pattern_threats), len(suspicious_urls), parsed
         )
         
+        # obvious phishing, or a short email with nothing suspicious
+        obvious_phish = estimate >= settings.get('high', 90)
+        obvious_safe = (estimate <= settings.get('low', 5)
+                        and len(parsed['body']) < settings.get('max_body_chars', 200))
+        if not (obvious_phish or obvious_safe):
+            return None
+        
+        return {
+            'score': estimate,
+            'threats': [],
+            'confidence': 0.6,
+            'skipped': True
+        }
+    
+    def _build_result(self, scan: Dict, gpt_result: Dict) -> DetectionResult:
+        """Combine local checks and GPT verdict into a detection result"""
+        pattern_threats = scan['pattern_threats']
+        suspicious_urls = scan['suspicious_urls']
+        n_patterns = len(pattern_threats)
+        n_suspicious = len(suspicious_urls)
+        
         # combine signals
         all_threats = pattern_threats + gpt_result.get('threats', [])
         
         # add url threats
-        if suspicious_urls:
-            all_threats.append(f"⚠️ Suspicious URL detected: {len(suspicious_urls)} found")
+        if n_suspicious:
+            all_threats.append(_SUSPICIOUS_URL_WARNING + str(n_suspicious) + " found")
         
         # calculate risk score
         score = self.risk_scorer.calculate(
             gpt_score=gpt_result.get('score', 0),
-            pattern_matches=len(pattern_threats),
-            suspicious_urls=len(suspicious_urls),
-            parsed_data=parsed
+            pattern_matches=n_patterns,
+            suspicious_urls=n_suspicious,
+            parsed_data=scan['parsed']
         )
         
         # determine risk level
@@ -130,23 +270,19 @@ class PhishingDetector:
             threats=all_threats,
             suspicious_urls=suspicious_urls,
             analysis=gpt_result,
-            timestamp=datetime.now().isoformat(),
-            recommendations=recommendations
+            timestamp=_timestamp(),
+            recommendations=recommendations,
+            truncated=scan['truncated']
         )
     
-    def _extract_urls(self, text: str) -> List[str]:
-        """Extract URLs from text"""
-        url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+'
-        return re.findall(url_pattern, text)
-    
     def _get_risk_level(self, score: int) -> str:
         """Determine risk level from score"""
-        thresholds = self.config['risk_thresholds']
-        if score < thresholds['low']:
+        low, medium, high = self._thresholds
+        if score < low:
             return 'LOW'
-        elif score < thresholds['medium']:
+        elif score < medium:
             return 'MEDIUM'
-        elif score < thresholds['high']:
+        elif score < high:
             return 'HIGH'
         return 'CRITICAL'
     
@@ -154,17 +290,9 @@ class PhishingDetector:
                                  urls: List[str]) -> List[str]:
         """Generate security recommendations"""
         recommendations = []
-        
-        if score > 60:
-            recommendations.append("Do not click any links in this email")
-            recommendations.append("Verify sender through official channels")
-        
-        if urls:
-            recommendations.append("Hover over links to verify destinations")
-        
-        if score > 80:
-            recommendations.append("Report this email to your security team")
-            recommendations.append("Delete this email immediately")
+        for condition, messages in self.RECOMMENDATION_RULES:
+            if condition(score, urls):
+                recommendations.extend(messages)
         
         if not recommendations:
             recommendations.append("Email appears safe but remain vigilant")
@@ -173,16 +301,179 @@ class PhishingDetector:
     
     def batch_analyze(self, email_list: List[Dict]) -> List[DetectionResult]:
         """Analyze multiple emails"""
+        return list(self.iter_batch_analyze(email_list))
+    
+    def iter_batch_analyze(self, email_list: List[Dict]) -> Iterator[DetectionResult]:
+        """
+        Analyze multiple emails, yielding results as they complete
+        GPT verdicts are requested for several emails per API call
+        """
+        # identical emails are only analyzed once
+        keys = self._key_all(email_list)
+        unique = self._unique_emails(keys, email_list)
+        
+        # run local checks first
+        scans = self._scan_all(unique)
+        
+        # group gpt calls
+        batch_settings = self.config.get('batch_processing', {})
+        batch_size = batch_settings.get('gpt_batch_size', 8)
+        chunks = [scans[start:start + batch_size]
+                  for start in range(0, len(scans), batch_size)]
+        
+        # results by email key, None when analysis failed; malformed
+        # emails have no key and are skipped the same way
+        scanned = {scan['key'] for scan in scans}
+        done = {key: None for key in unique if key not in scanned}
+        done[None] = None
+        
+        position = 0
+        seen = set()
+        
+        # gpt calls are network bound, run chunks concurrently
+        workers = batch_settings.get('parallel_workers', 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map keeps input order
+            chunk_iter = executor.map(self._analyze_chunk, chunks)
+            while True:
+                # emit every email whose result is ready, duplicates included
+                while position < len(keys) and keys[position] in done:
+                    key = keys[position]
+                    position += 1
+                    result = done[key]
+                    if result is None:
+                        continue
+                    yield replace(result) if key in seen else result
+                    seen.add(key)
+                
+                chunk_results = next(chunk_iter, None)
+                if chunk_results is None:
+                    break
+                done.update(chunk_results)
+    
+    async def batch_analyze_async(self, email_list: List[Dict]) -> List[DetectionResult]:
+        """
+        Analyze multiple emails concurrently on the event loop
+        Uses the async OpenAI client instead of worker threads
+        """
+        # identical emails are only analyzed once
+        keys = self._key_all(email_list)
+        scans = self._scan_all(self._unique_emails(keys, email_list))
+        
+        # limit in-flight requests
+        workers = self.config.get('batch_processing', {}).get('parallel_workers', 4)
+        semaphore = asyncio.Semaphore(workers)
+        
+        async def analyze_one(scan: Dict) -> Dict:
+            if scan['local_verdict']:
+                return scan['local_verdict']
+            parsed = scan['parsed']
+            async with semaphore:
+                return await self.gpt_analyzer.analyze_async(
+                    sender=parsed['sender'],
+                    subject=parsed['subject'],
+                    body=parsed['body'],
+                    config=self.config
+                )
+        
+        gpt_results = await asyncio.gather(
+            *(analyze_one(scan) for scan in scans), return_exceptions=True
+        )
+        
+        done = {}
+        for scan, gpt_result in zip(scans, gpt_results):
+            try:
+                if isinstance(gpt_result, Exception):
+                    raise gpt_result
+                done[scan['key']] = self._build_result(scan, gpt_result)
+            except Exception as e:
+                # log error but continue
+                print(f"Error analyzing email: {e}")
+                continue
+        
+        # scatter back to every original position
         results = []
+        seen = set()
+        for key in keys:
+            if key not in done:
+                continue
+            results.append(replace(done[key]) if key in seen else done[key])
+            seen.add(key)
+        return results
+    
+    def _email_key(self, email: Dict) -> bytes:
+        """Stable digest identifying an email's content"""
+        h = hashlib.blake2b(digest_size=16)
+        for part in (email.get('sender', ''), email.get('subject', ''), email.get('body', '')):
+            h.update(part.encode())
+            h.update(b'\0')
+        headers = email.get('headers')
+        if headers:
+            h.update(repr(sorted(headers.items())).encode())
+        return h.digest()
+    
+    def _key_all(self, email_list: List[Dict]) -> List[Optional[bytes]]:
+        """Key every email, None for malformed ones"""
+        keys = []
         for email in email_list:
             try:
-                result = self.analyze_email(
+                keys.append(self._email_key(email))
+            except Exception as e:
+                # log error but continue
+                print(f"Error analyzing email: {e}")
+                keys.append(None)
+        return keys
+    
+    def _unique_emails(self, keys: List[Optional[bytes]],
+                       email_list: List[Dict]) -> Dict[bytes, Dict]:
+        """Map each distinct key to its first email, keeping input order"""
+        unique = {}
+        for key, email in zip(keys, email_list):
+            if key is not None:
+                unique.setdefault(key, email)
+        return unique
+    
+    def _scan_all(self, emails: Dict[bytes, Dict]) -> List[Dict]:
+        """Run local checks on every email, skipping failures"""
+        scans = []
+        for key, email in emails.items():
+            try:
+                scan = self._scan_email(
                     sender=email.get('sender', ''),
                     subject=email.get('subject', ''),
                     body=email.get('body', ''),
                     headers=email.get('headers')
                 )
-                results.append(result)
+                scan['key'] = key
+                scans.append(scan)
+            except Exception as e:
+                # log error but continue
+                print(f"Error analyzing email: {e}")
+                continue
+        return scans
+    
+    def _analyze_chunk(self, chunk: List[Dict]) -> Dict[bytes, Optional[DetectionResult]]:
+        """
+        Run one batched GPT call and build results for its emails
+        Returns results by email key, None for failures
+        """
+        results = dict.fromkeys(scan['key'] for scan in chunk)
+        
+        # only ask gpt about emails without a conclusive local verdict
+        needs_gpt = [scan for scan in chunk if not scan['local_verdict']]
+        try:
+            gpt_results = iter(self.gpt_analyzer.analyze_batch(
+                [scan['parsed'] for scan in needs_gpt], self.config
+            ))
+        except Exception as e:
+            # log error but continue
+            print(f"Error analyzing emails: {e}")
+            return results
+        
+        for scan in chunk:
+            gpt_result = scan['local_verdict'] or next(gpt_results)
+            try:
+                results[scan['key']] = self._build_result(scan, gpt_result)
             except Exception as e:
                 # log error but continue
                 print(f"Error analyzing email: {e}")
@@ -192,6 +483,10 @@ class PhishingDetector:
     def generate_report(self, result: DetectionResult, format: str = 'json') -> str:
         """Generate analysis report"""
         return self.reporter.generate(result, format)
+    
+    def write_report(self, result: DetectionResult, fp, format: str = 'json') -> None:
+        """Write analysis report to an open text file"""
+        self.reporter.generate_stream(result, fp, format)
 
 def main():
     """CLI entry point"""
@@ -240,9 +535,8 @@ def main():
         
         # save if output specified
         if args.output:
-            report = detector.generate_report(result)
             with open(args.output, 'w') as f:
-                f.write(report)
+                detector.write_report(result, f)
             print(f"\nReport saved to {args.output}")
     
     elif args.command == 'batch':
@@ -0,0 +1,29 @@
+"""
+Gunicorn configuration for the web interface
+Run with: gunicorn app:app
+"""
+
+import multiprocessing
+import os
+
+# bind to the same port as app.py
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 5000)}"
+
+# requests spend most of their time waiting on the OpenAI API,
+# so use cooperative gevent workers instead of sync ones
+worker_class = 'gevent'
+worker_connections = 1000
+workers = multiprocessing.cpu_count() * 2 + 1
+
+# the gevent worker monkey-patches the standard library before it
+# imports app.py, so the OpenAI client's sockets become cooperative.
+# keep preload_app off: preloading would import openai/httpx in the
+# master before patching happens
+preload_app = False
+
+timeout = 60
+
+def post_worker_init(worker):
+    """Warm the OpenAI connection so the first request skips DNS/TLS setup"""
+    from app import detector
+    detector.gpt_analyzer.warm_up()
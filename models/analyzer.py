@@ -4,18 +4,38 @@ Handles OpenAI GPT integration for phishing detection
 """
 
 import openai
-import json
+import orjson
+import hashlib
 from typing import Dict, List, Optional
 import time
 
+from .cache import MemoryCache
+
 class GPTAnalyzer:
     """GPT-based email analysis"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, cache=None, timeout: float = 10.0,
+                 connect_timeout: float = 3.0, max_retries: int = 2):
         self.api_key = api_key
-        from openai import OpenAI
-        self.client = OpenAI(api_key=api_key)
-        self.cache = {}  # simple cache
+        from openai import OpenAI, AsyncOpenAI
+        # bound tail latency on slow connections
+        client_timeout = openai.Timeout(timeout, connect=connect_timeout)
+        self.client = OpenAI(api_key=api_key, timeout=client_timeout,
+                             max_retries=max_retries)
+        self.aclient = AsyncOpenAI(api_key=api_key, timeout=client_timeout,
+                                   max_retries=max_retries)
+        self.cache = cache if cache is not None else MemoryCache()
+    
+    def warm_up(self):
+        """
+        Open the API connection ahead of the first request
+        Pays DNS and TLS setup cost at startup instead
+        """
+        try:
+            self.client.models.list()
+        except Exception:
+            # warm-up is best effort
+            pass
         
     def analyze(self, sender: str, subject: str, body: str, 
                 config: Dict) -> Dict:
@@ -25,8 +45,9 @@ class GPTAnalyzer:
         """
         # check cache
         cache_key = self._get_cache_key(sender, subject, body)
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         # build prompt
         prompt = self._build_prompt(sender, subject, body)
@@ -34,20 +55,14 @@ class GPTAnalyzer:
         try:
             # call gpt - updated api
             response = self.client.chat.completions.create(
-                model=config.get('model', 'gpt-4'),
-                messages=[
-                    {"role": "system", "content": self._get_system_prompt()},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=config.get('temperature', 0.3),
-                max_tokens=config.get('max_tokens', 500)
+                **self._completion_args(self._get_system_prompt(), prompt, config)
             )
             
             # parse response
             result = self._parse_response(response.choices[0].message.content)
             
             # cache result
-            self.cache[cache_key] = result
+            self.cache.set(cache_key, result)
             
             return result
             
@@ -59,6 +74,120 @@ class GPTAnalyzer:
                 'confidence': 0.5
             }
     
+    async def analyze_async(self, sender: str, subject: str, body: str,
+                            config: Dict) -> Dict:
+        """
+        Analyze email with GPT without blocking the event loop
+        Returns threats and confidence score
+        """
+        # check cache
+        cache_key = self._get_cache_key(sender, subject, body)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # build prompt
+        prompt = self._build_prompt(sender, subject, body)
+        
+        try:
+            response = await self.aclient.chat.completions.create(
+                **self._completion_args(self._get_system_prompt(), prompt, config)
+            )
+            
+            # parse response
+            result = self._parse_response(response.choices[0].message.content)
+            
+            # cache result
+            self.cache.set(cache_key, result)
+            
+            return result
+            
+        except Exception as e:
+            # fallback on error
+            return {
+                'score': 50,
+                'threats': [f'Analysis error: {str(e)}'],
+                'confidence': 0.5
+            }
+    
+    def analyze_batch(self, emails: List[Dict], config: Dict) -> List[Dict]:
+        """
+        Analyze several emails with a single GPT request
+        Returns one result per email, in input order
+        """
+        results = [None] * len(emails)
+        pending = []
+        
+        # serve cached emails first; a full single-email verdict beats a
+        # batch one, but batch verdicts (shorter body, no indicators) are
+        # kept under their own key so analyze never returns them
+        for i, email in enumerate(emails):
+            sender, subject, body = (email.get('sender', ''), email.get('subject', ''),
+                                     email.get('body', ''))
+            cached = self.cache.get(self._get_cache_key(sender, subject, body))
+            if cached is None:
+                cache_key = self._get_cache_key(sender, subject, body, variant=b'batch')
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append((i, cache_key, email))
+        
+        if not pending:
+            return results
+        
+        # build one prompt for all uncached emails
+        prompt = self._build_batch_prompt([email for _, _, email in pending])
+        
+        try:
+            response = self.client.chat.completions.create(
+                **self._completion_args(self._get_batch_system_prompt(), prompt, config,
+                                        max_tokens=config.get('max_tokens', 500) * len(pending))
+            )
+            verdicts = self._parse_batch_response(
+                response.choices[0].message.content, len(pending)
+            )
+        except Exception as e:
+            # fallback on error
+            error_result = {
+                'score': 50,
+                'threats': [f'Analysis error: {str(e)}'],
+                'confidence': 0.5
+            }
+            for i, _, _ in pending:
+                results[i] = dict(error_result)
+            return results
+        
+        # scatter verdicts back by index
+        for (i, cache_key, email), verdict in zip(pending, verdicts):
+            if verdict is None:
+                # missing from batch response, ask individually
+                results[i] = self.analyze(
+                    sender=email.get('sender', ''),
+                    subject=email.get('subject', ''),
+                    body=email.get('body', ''),
+                    config=config
+                )
+                continue
+            self.cache.set(cache_key, verdict)
+            results[i] = verdict
+        
+        return results
+    
+    def _completion_args(self, system_prompt: str, prompt: str, config: Dict,
+                         max_tokens: int = None) -> Dict:
+        """Build chat completion arguments"""
+        return {
+            'model': config.get('model', 'gpt-4o'),
+            'messages': [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            'temperature': config.get('temperature', 0.3),
+            'max_tokens': max_tokens or config.get('max_tokens', 500),
+            'response_format': {'type': 'json_object'}
+        }
+    
     def _get_system_prompt(self) -> str:
         """System prompt for GPT"""
         return """You are an expert email security analyst. Analyze emails for phishing indicators.
@@ -89,37 +218,81 @@ Body:
 
 Provide detailed phishing analysis in JSON format."""
     
-    def _parse_response(self, response: str) -> Dict:
-        """Parse GPT response"""
-        try:
-            # extract json
-            start = response.find('{')
-            end = response.rfind('}') + 1
-            if start >= 0 and end > start:
-                json_str = response[start:end]
-                return json.loads(json_str)
-        except:
-            pass
+    def _get_batch_system_prompt(self) -> str:
+        """System prompt for multi-email GPT requests"""
+        return """You are an expert email security analyst. Analyze each email for phishing indicators.
+        
+        Return a JSON object with a "results" list holding one object per email:
+        - index: the email number given in its header
+        - score: 0-100 phishing likelihood
+        - threats: list of specific threats found
+        - confidence: your confidence level 0-1
+        
+        Look for:
+        - Spoofed sender addresses
+        - Urgency/fear tactics
+        - Suspicious URLs
+        - Grammar/spelling errors
+        - Requests for sensitive info
+        - Too good to be true offers"""
+    
+    def _build_batch_prompt(self, emails: List[Dict]) -> str:
+        """Build analysis prompt for several emails"""
+        blocks = []
+        for i, email in enumerate(emails, 1):
+            blocks.append(f"""=== EMAIL {i} ===
+From: {email.get('sender', '')}
+Subject: {email.get('subject', '')}
+
+Body:
+{email.get('body', '')[:800]}""")
         
-        # fallback parsing
-        threats = []
-        score = 50
+        return (f"Analyze these {len(emails)} emails for phishing:\n\n"
+                + "\n\n".join(blocks)
+                + "\n\nProvide one verdict per email in the JSON results list.")
+    
+    def _parse_batch_response(self, response: str, count: int) -> List[Optional[Dict]]:
+        """
+        Parse GPT response for a batch prompt
+        Returns one verdict per email, None where missing
+        """
+        verdicts = [None] * count
+        try:
+            items = orjson.loads(response).get('results', [])
+        except (orjson.JSONDecodeError, AttributeError):
+            return verdicts
         
-        # extract threats from text
-        if 'suspicious' in response.lower():
-            threats.append("Suspicious content detected")
-        if 'phishing' in response.lower():
-            score = 75
-        if 'urgent' in response.lower():
-            threats.append("Urgency tactics detected")
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            try:
+                index = int(item.pop('index', position + 1))
+            except (TypeError, ValueError):
+                continue
+            if 1 <= index <= count:
+                verdicts[index - 1] = item
         
-        return {
-            'score': score,
-            'threats': threats,
-            'confidence': 0.7
-        }
+        return verdicts
+    
+    def _parse_response(self, response: str) -> Dict:
+        """
+        Parse GPT response
+        JSON mode guarantees an object, decode errors propagate
+        """
+        return orjson.loads(response)
     
-    def _get_cache_key(self, sender: str, subject: str, body: str) -> str:
-        """Generate cache key"""
-        content = f"{sender}:{subject}:{body[:200]}"
-        return str(hash(content))
+    def _get_cache_key(self, sender: str, subject: str, body: str,
+                       variant: bytes = b'') -> bytes:
+        """
+        Generate stable cache key
+        Returns digest, distinct per prompt variant
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(sender.encode())
+        h.update(b'\0')
+        h.update(subject.encode())
+        h.update(b'\0')
+        h.update(body[:2000].encode())
+        if variant:
+            h.update(b'\0' + variant)
+        return h.digest()
@@ -0,0 +1,74 @@
+"""
+Micro-Batcher Module
+Groups concurrent single-email GPT requests into batched calls
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict
+
+class MicroBatcher:
+    """Collects queued emails and sends them to GPT together"""
+    
+    def __init__(self, analyzer, config: Dict, max_batch_size: int = 16,
+                 max_wait: float = 0.05, workers: int = 4):
+        self.analyzer = analyzer
+        self.config = config
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait  # seconds
+        self.queue = queue.Queue()
+        
+        # batches run on a pool so collecting never waits on the api
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def submit(self, sender: str, subject: str, body: str) -> Future:
+        """Queue an email, returns a future for its GPT verdict"""
+        future = Future()
+        email = {'sender': sender, 'subject': subject, 'body': body}
+        self.queue.put((email, future))
+        return future
+    
+    def analyze(self, sender: str, subject: str, body: str,
+                timeout: float = 30) -> Dict:
+        """Queue an email and wait for its GPT verdict"""
+        return self.submit(sender, subject, body).result(timeout=timeout)
+    
+    def _run(self):
+        """Collect batches until max_batch_size or max_wait is reached"""
+        while True:
+            # block until there is work
+            items = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            
+            while len(items) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            self._executor.submit(self._dispatch, items)
+    
+    def _dispatch(self, items: list):
+        """Send one batch to GPT and resolve its futures"""
+        try:
+            if len(items) == 1:
+                email, _ = items[0]
+                results = [self.analyzer.analyze(config=self.config, **email)]
+            else:
+                results = self.analyzer.analyze_batch(
+                    [email for email, _ in items], self.config
+                )
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(items, results):
+            future.set_result(result)
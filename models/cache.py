@@ -0,0 +1,77 @@
+"""
+Cache Backends Module
+Stores GPT verdicts keyed by a stable content digest
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import orjson
+
+class MemoryCache:
+    """In-process LRU cache with expiry"""
+    
+    def __init__(self, max_size: int = 1000, ttl_seconds: int = 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, value), oldest first
+        self._lock = threading.Lock()
+    
+    def get(self, key: bytes) -> Optional[Dict]:
+        """Look up value, marking it recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key: bytes, value: Dict):
+        """Store value, evicting least recently used entries"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class RedisCache:
+    """Redis-backed cache shared by every worker process"""
+    
+    def __init__(self, client, ttl_seconds: int = 3600, prefix: bytes = b'gpt:'):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+    
+    @classmethod
+    def from_url(cls, url: str, ttl_seconds: int = 3600) -> 'RedisCache':
+        """Connect to redis (requires the redis package)"""
+        import redis
+        return cls(redis.Redis.from_url(url), ttl_seconds)
+    
+    def get(self, key: bytes) -> Optional[Dict]:
+        """Look up value, treating redis errors and undecodable values as a miss"""
+        try:
+            raw = self.client.get(self.prefix + key)
+            value = orjson.loads(raw) if raw is not None else None
+        except Exception:
+            return None
+        # foreign values under the prefix are not verdicts
+        return value if isinstance(value, dict) else None
+    
+    def set(self, key: bytes, value: Dict):
+        """Store value with expiry, ignoring redis errors"""
+        try:
+            self.client.set(self.prefix + key, orjson.dumps(value), ex=self.ttl_seconds)
+        except Exception:
+            pass
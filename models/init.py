@@ -2,7 +2,9 @@
 Models package for phishing detection
 """
 from .analyzer import GPTAnalyzer
+from .batcher import MicroBatcher
+from .cache import MemoryCache, RedisCache
 from .patterns import PatternMatcher
 from .scorer import RiskScorer
 
-__all__ = ['GPTAnalyzer', 'PatternMatcher', 'RiskScorer']
\ No newline at end of file
+__all__ = ['GPTAnalyzer', 'MicroBatcher', 'MemoryCache', 'RedisCache', 'PatternMatcher', 'RiskScorer']
\ No newline at end of file
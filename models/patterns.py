@@ -4,7 +4,21 @@ Rule-based pattern detection for common phishing tactics
 """
 
 import re
-from typing import List, Dict
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from urllib.parse import urlsplit
+from typing import List, Dict, Sequence, Union
+
+from utils.parser import ParsedSender, parse_sender
+
+try:
+    import re2 as _engine  # linear-time matching for untrusted input
+except ImportError:
+    _engine = re
+
+# the pattern score saturates here (7 * 15 >= 100), more threats add nothing
+MAX_THREATS = 7
 
 class PatternMatcher:
     """Pattern-based phishing detection"""
@@ -52,39 +66,92 @@ class PatternMatcher:
             (r'payp[a@]l', 'PayPal'),
             (r'app[l1]e', 'Apple'),
         ]
+        
+        # compiled once, reused for every email
+        # one pass for every brand; the group name says which matched
+        self._spoof_re = _engine.compile('|'.join(
+            f'(?P<b{i}>{pattern})' for i, (pattern, _) in enumerate(self.spoofed_patterns)))
+        self._spoof_brands = {f'b{i}': company
+                              for i, (_, company) in enumerate(self.spoofed_patterns)}
+        # senders and campaign urls recur across emails
+        self._spoofed_brands = lru_cache(maxsize=8192)(self._find_spoofed_brands)
+        # the shortener entries are escaped literals, probed with str.find
+        self._shorteners = tuple(p.replace('\\', '') for p in self.suspicious_domains[:3])
+        self._suspicious_tlds = ('.tk', '.ml', '.ga', '.cf', '.click', '.download')
+        self._ip_re = _engine.compile(self.suspicious_domains[3])
+        self._digit_re = _engine.compile(r'\d')
+        self._grammar_res = [
+            _engine.compile(r'\s{2,}'),        # multiple spaces
+            _engine.compile(r'[a-z]\s+[A-Z]'),  # capitalization
+            _engine.compile(r'\.\s*[a-z]'),     # sentence start
+        ]
+        
+        # keyword categories, probed with C-level substring search
+        self._keyword_sets = {
+            'financial': frozenset(self.financial_words),
+            'credential': frozenset(self.credential_words),
+            'phrase': frozenset(self.suspicious_phrases),
+        }
+        self._body_keywords = tuple(dict.fromkeys(
+            self.suspicious_phrases + self.credential_words
+            + self.financial_words + ['urgent']))
+    
+    @staticmethod
+    def _find_keywords(text_lower: str, keywords) -> set:
+        """
+        Find keywords present in text
+        Returns set of keywords
+        """
+        return {word for word in keywords if word in text_lower}
+    
+    def _find_spoofed_brands(self, text_lower: str) -> tuple:
+        """
+        Find brands imitated in text
+        Returns companies in spoofed_patterns order
+        """
+        matched = {m.lastgroup for m in self._spoof_re.finditer(text_lower)}
+        return tuple(company for tag, company in self._spoof_brands.items() if tag in matched)
     
     def check(self, parsed_email: Dict) -> List[str]:
         """Check email against patterns"""
-        threats = []
+        sender = parsed_email.get('sender_obj') or parsed_email.get('sender') or ''
+        subject = parsed_email.get('subject') or ''
+        body = parsed_email.get('body') or ''
+        urls = parsed_email.get('urls') or ()
         
+        # cheapest first; stop once the pattern score is saturated
         # check sender
-        sender_threats = self._check_sender(parsed_email.get('sender', ''))
-        threats.extend(sender_threats)
+        threats = self._check_sender(sender)
         
         # check subject
-        subject_threats = self._check_subject(parsed_email.get('subject', ''))
-        threats.extend(subject_threats)
+        if len(threats) < MAX_THREATS:
+            threats.extend(self._check_subject(subject, parsed_email.get('subject_lower')))
+        
+        # check urls
+        if len(threats) < MAX_THREATS:
+            threats.extend(self._check_urls(urls))
         
         # check body
-        body_threats = self._check_body(parsed_email.get('body', ''))
-        threats.extend(body_threats)
+        if len(threats) < MAX_THREATS:
+            threats.extend(self._check_body(body, parsed_email.get('body_lower')))
         
-        # check urls
-        url_threats = self._check_urls(parsed_email.get('urls', []))
-        threats.extend(url_threats)
+        # grammar check (simple), the only full regex walk of the body
+        if len(threats) < MAX_THREATS and self._check_grammar(body) > 3:
+            threats.append("Multiple grammar/spelling errors")
         
         return threats
     
-    def _check_sender(self, sender: str) -> List[str]:
+    def _check_sender(self, sender: Union[str, ParsedSender]) -> List[str]:
         """Check sender for spoofing"""
         threats = []
-        sender_lower = sender.lower()
+        if isinstance(sender, str):
+            sender = parse_sender(sender)
+        sender_lower = sender.lower
         
         # check for spoofed domains
-        for pattern, company in self.spoofed_patterns:
-            if re.search(pattern, sender_lower):
-                if company.lower() not in sender_lower:
-                    threats.append(f"⚠️ Possible {company} spoofing detected")
+        for company in self._spoofed_brands(sender_lower):
+            if company.lower() not in sender_lower:
+                threats.append(f"⚠️ Possible {company} spoofing detected")
         
         # check for no-reply suspicious
         if 'no-reply' in sender_lower and any(word in sender_lower 
@@ -92,22 +159,19 @@ class PatternMatcher:
             threats.append("Suspicious no-reply address")
         
         # check display name tricks
-        if '<' in sender and '>' in sender:
-            display = sender.split('<')[0].strip()
-            actual = sender.split('<')[1].split('>')[0]
-            if '@' in display:
-                threats.append("Misleading display name")
+        if '@' in sender.display:
+            threats.append("Misleading display name")
         
         return threats
     
-    def _check_subject(self, subject: str) -> List[str]:
+    def _check_subject(self, subject: str, subject_lower: str = None) -> List[str]:
         """Check subject line"""
         threats = []
-        subject_lower = subject.lower()
+        if subject_lower is None:
+            subject_lower = subject.lower()
         
         # urgency check
-        urgency_count = sum(1 for word in self.urgency_words 
-                          if word in subject_lower)
+        urgency_count = len(self._find_keywords(subject_lower, self.urgency_words))
         if urgency_count >= 2:
             threats.append("Multiple urgency indicators in subject")
         
@@ -121,60 +185,82 @@ class PatternMatcher:
         
         return threats
     
-    def _check_body(self, body: str) -> List[str]:
+    def _check_body(self, body: str, body_lower: str = None) -> List[str]:
         """Check email body"""
         threats = []
-        body_lower = body.lower()
+        if body_lower is None:
+            body_lower = body.lower()
+        
+        found = self._find_keywords(body_lower, self._body_keywords)
         
         # suspicious phrases
-        for phrase in self.suspicious_phrases:
-            if phrase in body_lower:
-                threats.append(f"Suspicious phrase: '{phrase}'")
+        if found & self._keyword_sets['phrase']:
+            for phrase in self.suspicious_phrases:
+                if phrase in found:
+                    threats.append(f"Suspicious phrase: '{phrase}'")
         
         # credential harvesting
-        cred_count = sum(1 for word in self.credential_words 
-                        if word in body_lower)
+        cred_count = len(found & self._keyword_sets['credential'])
         if cred_count >= 3:
             threats.append("Potential credential harvesting attempt")
         
         # financial scam
-        fin_count = sum(1 for word in self.financial_words 
-                       if word in body_lower)
-        if fin_count >= 3 and 'urgent' in body_lower:
+        fin_count = len(found & self._keyword_sets['financial'])
+        if fin_count >= 3 and 'urgent' in found:
             threats.append("Potential financial scam")
         
-        # grammar check (simple)
-        typos = self._check_grammar(body)
-        if typos > 3:
-            threats.append("Multiple grammar/spelling errors")
-        
         return threats
     
-    def _check_urls(self, urls: List[str]) -> List[str]:
+    def _check_urls(self, urls: Sequence[str]) -> List[str]:
         """Check URLs for suspicious patterns"""
         threats = []
+        if not urls:
+            return threats
         
-        for url in urls:
-            url_lower = url.lower()
-            
-            # url shorteners
-            for pattern in self.suspicious_domains[:3]:
-                if re.search(pattern, url_lower):
-                    threats.append(f"URL shortener detected: {url[:30]}...")
-                    break
+        # scan every url in one blob; no checked pattern can match '\x1f',
+        # so matches never span two urls, and offsets map back by length
+        urls_lower = [url.lower() for url in urls]
+        blob = '\x1f'.join(urls_lower)
+        starts = list(accumulate((len(url) + 1 for url in urls_lower[:-1]), initial=0))
+        
+        # url shorteners
+        shortened = set()
+        for shortener in self._shorteners:
+            pos = blob.find(shortener)
+            while pos >= 0:
+                shortened.add(bisect_right(starts, pos) - 1)
+                pos = blob.find(shortener, pos + 1)
+        
+        # ip addresses; most urls lack the three dots or any digit
+        ip_urls = set()
+        if blob.count('.') >= 3 and self._digit_re.search(blob):
+            ip_urls = {bisect_right(starts, m.start()) - 1
+                       for m in self._ip_re.finditer(blob)}
+        
+        # homograph attack
+        spoofed = {}
+        for m in self._spoof_re.finditer(blob):
+            spoofed.setdefault(bisect_right(starts, m.start()) - 1, set()).add(m.lastgroup)
+        
+        for index, url in enumerate(urls):
+            if index in shortened:
+                threats.append(f"URL shortener detected: {url[:30]}...")
             
-            # ip addresses
-            if re.search(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', url):
+            if index in ip_urls:
                 threats.append("Direct IP address URL")
             
-            # homograph attack
-            for pattern, company in self.spoofed_patterns:
-                if re.search(pattern, url_lower):
-                    threats.append(f"Possible {company} URL spoofing")
+            if index in spoofed:
+                tags = spoofed[index]
+                for tag, company in self._spoof_brands.items():
+                    if tag in tags:
+                        threats.append(f"Possible {company} URL spoofing")
             
-            # suspicious tld
-            suspicious_tlds = ['.tk', '.ml', '.ga', '.cf', '.click', '.download']
-            if any(tld in url_lower for tld in suspicious_tlds):
+            # suspicious tld, on the host only so paths like .html don't count
+            try:
+                host = urlsplit(urls_lower[index]).hostname or ''
+            except ValueError:
+                host = ''
+            if host.endswith(self._suspicious_tlds):
                 threats.append("Suspicious domain extension")
         
         return threats
@@ -183,14 +269,11 @@ class PatternMatcher:
         """Simple grammar error detection"""
         errors = 0
         
-        # common mistakes
-        mistakes = [
-            (r'\s{2,}', 'multiple spaces'),
-            (r'[a-z]\s+[A-Z]', 'capitalization'),
-            (r'\.\s*[a-z]', 'sentence start'),
-        ]
-        
-        for pattern, _ in mistakes:
-            errors += len(re.findall(pattern, text))
+        # common mistakes; stop walking the body once the cap is hit
+        for pattern in self._grammar_res:
+            for _ in pattern.finditer(text):
+                errors += 1
+                if errors >= 10:
+                    return 10
         
-        return min(errors, 10)  # cap at 10
\ No newline at end of file
+        return errors
\ No newline at end of file
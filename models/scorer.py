@@ -3,7 +3,9 @@ Risk Scorer Module
 Calculates phishing risk scores from multiple signals
 """
 
-from typing import Dict, List
+from typing import Dict, List, Union
+
+from utils.parser import ParsedSender, parse_sender
 
 class RiskScorer:
     """Risk score calculation"""
@@ -16,13 +18,20 @@ class RiskScorer:
             'url_suspicious': 0.2,
             'sender_trust': 0.15
         }
+        self._w_gpt = self.weights['gpt_score']
+        self._w_pat = self.weights['pattern_matches']
+        self._w_url = self.weights['url_suspicious']
+        self._w_send = self.weights['sender_trust']
         
         # trusted domains
-        self.trusted_domains = [
+        self.trusted_domains = frozenset((
             'gmail.com', 'outlook.com', 'yahoo.com',
             'amazon.com', 'microsoft.com', 'google.com',
             'apple.com', 'paypal.com', 'ebay.com'
-        ]
+        ))
+        
+        self._suspicious_keywords = ('security', 'alert', 'verify', 'suspend')
+        self._dangerous_ext = ('.exe', '.zip', '.scr', '.vbs', '.js')
     
     def calculate(self, gpt_score: int, pattern_matches: int,
                  suspicious_urls: int, parsed_data: Dict) -> int:
@@ -30,63 +39,67 @@ class RiskScorer:
         Calculate final risk score
         Returns score 0-100
         """
-        scores = {}
-        
-        # gpt component
-        scores['gpt'] = gpt_score * self.weights['gpt_score']
+        sender_score = self._calculate_sender_trust(
+            parsed_data.get('sender_obj') or parsed_data.get('sender', ''))
         
-        # pattern component (max 100)
-        pattern_score = min(pattern_matches * 15, 100)
-        scores['patterns'] = pattern_score * self.weights['pattern_matches']
+        # weighted gpt, pattern (max 100), url (max 100) and sender
+        # components plus additional factors
+        final_score = (gpt_score * self._w_gpt
+                       + min(pattern_matches * 15, 100) * self._w_pat
+                       + min(suspicious_urls * 30, 100) * self._w_url
+                       + sender_score * self._w_send
+                       + self._calculate_bonus_factors(parsed_data))
         
-        # url component
-        url_score = min(suspicious_urls * 30, 100)
-        scores['urls'] = url_score * self.weights['url_suspicious']
-        
-        # sender trust component
-        sender_score = self._calculate_sender_trust(parsed_data.get('sender', ''))
-        scores['sender'] = sender_score * self.weights['sender_trust']
+        # ensure 0-100 range
+        return max(0, min(100, int(final_score)))
+    
+    def cheap_estimate(self, pattern_matches: int, suspicious_urls: int,
+                       parsed_data: Dict) -> int:
+        """
+        Estimate risk from local signals only
+        Returns score 0-100 with the GPT weight spread over the rest
+        """
+        local_weight = 1 - self._w_gpt
         
-        # additional factors
-        bonus = self._calculate_bonus_factors(parsed_data)
+        pattern_score = min(pattern_matches * 15, 100) * self._w_pat
+        url_score = min(suspicious_urls * 30, 100) * self._w_url
+        sender_score = (self._calculate_sender_trust(
+            parsed_data.get('sender_obj') or parsed_data.get('sender', ''))
+                        * self._w_send)
         
-        # final score
-        final_score = sum(scores.values()) + bonus
+        estimate = ((pattern_score + url_score + sender_score) / local_weight
+                    + self._calculate_bonus_factors(parsed_data))
         
-        # ensure 0-100 range
-        return max(0, min(100, int(final_score)))
+        return max(0, min(100, int(estimate)))
     
-    def _calculate_sender_trust(self, sender: str) -> int:
+    def _calculate_sender_trust(self, sender: Union[str, ParsedSender]) -> int:
         """Calculate sender trust score"""
-        sender_lower = sender.lower()
+        if isinstance(sender, str):
+            sender = parse_sender(sender)
+        sender_lower = sender.lower
         
-        # check trusted domains
-        for domain in self.trusted_domains:
-            if f'@{domain}' in sender_lower:
-                # verify not spoofed
-                if sender_lower.count('@') == 1:
-                    return 0  # trusted
+        # check trusted domains; a single @ rules out spoofing
+        if sender.at_count == 1 and sender.domain.lower() in self.trusted_domains:
+            return 0  # trusted
         
         # suspicious indicators
         suspicious_score = 0
         
         # no domain
-        if '@' not in sender:
+        if sender.at_count == 0:
             suspicious_score += 50
         
         # multiple @ symbols
-        if sender.count('@') > 1:
+        if sender.at_count > 1:
             suspicious_score += 30
         
         # numbers in domain
-        if '@' in sender:
-            domain = sender.split('@')[-1]
-            if any(c.isdigit() for c in domain.split('.')[0]):
+        if sender.domain:
+            if any(c.isdigit() for c in sender.domain.split('.')[0]):
                 suspicious_score += 20
         
         # suspicious keywords
-        suspicious_keywords = ['security', 'alert', 'verify', 'suspend']
-        for keyword in suspicious_keywords:
+        for keyword in self._suspicious_keywords:
             if keyword in sender_lower:
                 suspicious_score += 15
         
@@ -98,9 +111,8 @@ class RiskScorer:
         
         # attachment check
         attachments = parsed_data.get('attachments', [])
-        dangerous_extensions = ['.exe', '.zip', '.scr', '.vbs', '.js']
         for attachment in attachments:
-            if any(attachment.lower().endswith(ext) for ext in dangerous_extensions):
+            if attachment.lower().endswith(self._dangerous_ext):
                 bonus += 20
         
         # time factors
@@ -4,16 +4,55 @@ Run with: pytest tests/test_detector.py
 """
 
 import pytest
+import asyncio
+import hashlib
+import json
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from detector import PhishingDetector
+from detector import DetectionResult, PhishingDetector, MAX_SCAN_CHARS
+from models.analyzer import GPTAnalyzer
+from models.batcher import MicroBatcher
+from models.cache import MemoryCache, RedisCache
 from models.patterns import PatternMatcher
 from models.scorer import RiskScorer
-from utils.parser import EmailParser
+from utils.parser import EmailParser, parse_sender
+from utils.reporter import ReportGenerator
 from utils.validators import URLValidator
 
+class FakeCompletions:
+    """Stands in for client.chat.completions, returns canned replies"""
+    
+    def __init__(self, content):
+        self.content = content
+        self.calls = []
+    
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        content = self.content(kwargs) if callable(self.content) else self.content
+        message = type('Message', (), {'content': content})
+        choice = type('Choice', (), {'message': message})
+        return type('Response', (), {'choices': [choice]})
+
+def fake_client(content):
+    """Build a fake OpenAI client"""
+    completions = FakeCompletions(content)
+    chat = type('Chat', (), {'completions': completions})
+    return type('Client', (), {'chat': chat})
+
+class FakeAsyncCompletions(FakeCompletions):
+    """Async variant of FakeCompletions"""
+    
+    async def create(self, **kwargs):
+        return FakeCompletions.create(self, **kwargs)
+
+def fake_async_client(content):
+    """Build a fake AsyncOpenAI client"""
+    completions = FakeAsyncCompletions(content)
+    chat = type('Chat', (), {'completions': completions})
+    return type('Client', (), {'chat': chat})
+
 class TestPhishingDetector:
     """Test main detector"""
     
@@ -22,6 +61,12 @@ class TestPhishingDetector:
         # mock api key for testing
         return PhishingDetector(api_key='test-key')
     
+    @pytest.fixture
+    def gpt_detector(self, detector):
+        # always call gpt, even for obvious verdicts
+        detector.config['gpt_short_circuit'] = {'enabled': False}
+        return detector
+    
     def test_initialization(self, detector):
         """Test detector initialization"""
         assert detector is not None
@@ -31,7 +76,7 @@ class TestPhishingDetector:
     def test_extract_urls(self, detector):
         """Test URL extraction"""
         text = "Visit https://example.com and http://test.org for more"
-        urls = detector._extract_urls(text)
+        urls = detector.email_parser._extract_urls(text)
         assert len(urls) == 2
         assert 'https://example.com' in urls
     
@@ -42,6 +87,204 @@ class TestPhishingDetector:
         assert detector._get_risk_level(70) == 'HIGH'
         assert detector._get_risk_level(90) == 'CRITICAL'
 
+    def test_long_body_truncated(self, detector):
+        """Test local checks only see the first MAX_SCAN_CHARS of the body"""
+        body = 'a' * MAX_SCAN_CHARS + ' https://example.tk/login'
+        scan = detector._scan_email('user@example.com', 'Hi', body)
+        assert scan['truncated']
+        assert scan['parsed']['urls'] == []
+    
+    def test_obvious_safe_email_skips_gpt(self, detector):
+        """Test short clean emails are scored without a GPT call"""
+        detector.gpt_analyzer.client = fake_client('{"score": 90}')
+        result = detector.analyze_email('friend@example.com', 'Lunch', 'Noon works for me.')
+        
+        assert result.analysis['skipped']
+        assert detector.gpt_analyzer.client.chat.completions.calls == []
+        
+        result = detector.analyze_email('friend@example.com', 'Lunch', 'Noon works for me.',
+                                        force_gpt=True)
+        assert result.analysis['score'] == 90
+    
+    def test_batch_analyze_groups_gpt_calls(self, gpt_detector):
+        """Test batch analysis sends several emails per GPT call"""
+        def reply(kwargs):
+            count = kwargs['messages'][1]['content'].count('=== EMAIL')
+            return json.dumps({'results': [{'index': i, 'score': 10, 'threats': []}
+                                           for i in range(1, count + 1)]})
+        
+        gpt_detector.gpt_analyzer.client = fake_client(reply)
+        emails = [{'sender': f'user{i}@example.com', 'subject': 'Hi', 'body': f'Note {i}'}
+                  for i in range(10)]
+        results = gpt_detector.batch_analyze(emails)
+        
+        assert len(results) == 10
+        assert len(gpt_detector.gpt_analyzer.client.chat.completions.calls) == 2
+
+    def test_batch_analyze_deduplicates(self, gpt_detector):
+        """Test identical emails in a batch are analyzed once"""
+        def reply(kwargs):
+            count = kwargs['messages'][1]['content'].count('=== EMAIL')
+            return json.dumps({'results': [{'index': i, 'score': 10, 'threats': []}
+                                           for i in range(1, count + 1)]})
+        
+        gpt_detector.gpt_analyzer.client = fake_client(reply)
+        campaign = {'sender': 'alert@example.com', 'subject': 'Verify', 'body': 'Act now'}
+        other = {'sender': 'friend@example.com', 'subject': 'Lunch', 'body': 'Noon?'}
+        results = gpt_detector.batch_analyze([campaign, other, campaign, campaign])
+        
+        calls = gpt_detector.gpt_analyzer.client.chat.completions.calls
+        assert len(results) == 4
+        assert calls[0]['messages'][1]['content'].count('=== EMAIL') == 2
+        assert results[0].threats == results[2].threats
+        assert results[0] is not results[2]
+    
+    def test_batch_analyze_skips_malformed_emails(self, gpt_detector):
+        """Test a malformed entry is skipped instead of failing the batch"""
+        gpt_detector.gpt_analyzer.client = fake_client(
+            '{"results": [{"index": 1, "score": 10, "threats": []}]}')
+        good = {'sender': 'friend@example.com', 'subject': 'Lunch', 'body': 'Noon?'}
+        bad = [{'sender': None, 'subject': 'Hi', 'body': 'Hello'},
+               {'sender': 'a@example.com', 'subject': 'Hi', 'body': 42},
+               'not an email']
+        
+        results = gpt_detector.batch_analyze([good] + bad)
+        assert len(results) == 1
+        
+        gpt_detector.gpt_analyzer.aclient = fake_async_client('{"score": 20, "threats": []}')
+        results = asyncio.run(gpt_detector.batch_analyze_async(bad + [good]))
+        assert len(results) == 1
+    
+    def test_batch_analyze_async(self, gpt_detector):
+        """Test async batch analysis returns one result per email"""
+        gpt_detector.gpt_analyzer.aclient = fake_async_client('{"score": 20, "threats": []}')
+        emails = [{'sender': f'user{i}@example.com', 'subject': 'Hi', 'body': f'Note {i}'}
+                  for i in range(3)]
+        results = asyncio.run(gpt_detector.batch_analyze_async(emails))
+        
+        assert len(results) == 3
+        assert all(r.analysis['score'] == 20 for r in results)
+
+class TestGPTAnalyzer:
+    """Test GPT analyzer"""
+    
+    @pytest.fixture
+    def analyzer(self):
+        return GPTAnalyzer(api_key='test-key')
+    
+    def test_parse_batch_response(self, analyzer):
+        """Test batch verdicts are scattered back by index"""
+        response = '{"results": [{"index": 2, "score": 90}, {"index": 1, "score": 5}]}'
+        verdicts = analyzer._parse_batch_response(response, 3)
+        assert verdicts[0]['score'] == 5
+        assert verdicts[1]['score'] == 90
+        assert verdicts[2] is None
+    
+    def test_analyze_batch_uses_cache(self, analyzer):
+        """Test cached emails skip the batch request"""
+        analyzer.client = fake_client('{"results": [{"index": 1, "score": 80, "threats": []}]}')
+        email = {'sender': 'a@example.com', 'subject': 'Hi', 'body': 'Hello'}
+        
+        first = analyzer.analyze_batch([email], {})
+        second = analyzer.analyze_batch([email], {})
+        
+        assert first[0]['score'] == 80
+        assert second == first
+        assert len(analyzer.client.chat.completions.calls) == 1
+
+    def test_requests_json_mode(self, analyzer):
+        """Test replies are requested and parsed as strict JSON"""
+        analyzer.client = fake_client('{"score": 30, "threats": []}')
+        result = analyzer.analyze('a@example.com', 'Hi', 'Hello', {})
+        
+        call = analyzer.client.chat.completions.calls[0]
+        assert call['response_format'] == {'type': 'json_object'}
+        assert result['score'] == 30
+    
+    def test_unparseable_reply_not_cached(self, analyzer):
+        """Test invalid JSON falls back without poisoning the cache"""
+        analyzer.client = fake_client('not json')
+        result = analyzer.analyze('a@example.com', 'Hi', 'Hello', {})
+        
+        assert result['score'] == 50
+        assert len(analyzer.cache) == 0
+    
+    def test_batch_verdict_not_served_to_analyze(self, analyzer):
+        """Test an email first seen in a batch still gets a full analysis"""
+        analyzer.client = fake_client(
+            '{"results": [{"index": 1, "score": 80, "threats": []}]}')
+        email = {'sender': 'a@example.com', 'subject': 'Hi', 'body': 'Hello'}
+        analyzer.analyze_batch([email], {})
+        
+        analyzer.client = fake_client('{"score": 30, "threats": [], "indicators": []}')
+        result = analyzer.analyze('a@example.com', 'Hi', 'Hello', {})
+        assert result['score'] == 30
+        assert 'indicators' in result
+        assert len(analyzer.client.chat.completions.calls) == 1
+        
+        # the full verdict now serves later batches too
+        assert analyzer.analyze_batch([email], {})[0] == result
+    
+    def test_cache_key_is_stable(self, analyzer):
+        """Test cache keys do not depend on hash seeding"""
+        key = analyzer._get_cache_key('a@example.com', 'Hi', 'Hello')
+        assert key == hashlib.blake2b(b'a@example.com\0Hi\0Hello', digest_size=16).digest()
+    
+    def test_cache_evicts_least_recently_used(self):
+        """Test cache stays bounded"""
+        cache = MemoryCache(max_size=2)
+        cache.set(b'a', {'score': 0})
+        cache.set(b'b', {'score': 1})
+        cache.get(b'a')  # refresh
+        cache.set(b'c', {'score': 2})
+        
+        assert len(cache) == 2
+        assert cache.get(b'b') is None
+        assert cache.get(b'a') == {'score': 0}
+    
+    def test_cache_entries_expire(self):
+        """Test cached verdicts expire after the ttl"""
+        cache = MemoryCache(ttl_seconds=-1)
+        cache.set(b'a', {'score': 0})
+        assert cache.get(b'a') is None
+
+    def test_redis_cache_treats_bad_values_as_miss(self):
+        """Test corrupt or foreign redis values are cache misses"""
+        store = {b'gpt:bad': b'not json{', b'gpt:num': b'42', b'gpt:ok': b'{"score": 5}'}
+        client = type('Client', (), {'get': lambda self, key: store.get(key)})()
+        cache = RedisCache(client)
+        
+        assert cache.get(b'bad') is None
+        assert cache.get(b'num') is None
+        assert cache.get(b'missing') is None
+        assert cache.get(b'ok') == {'score': 5}
+
+class TestMicroBatcher:
+    """Test micro-batching of single-email requests"""
+    
+    class FakeAnalyzer:
+        def __init__(self):
+            self.batches = []
+        
+        def analyze(self, sender, subject, body, config):
+            self.batches.append([sender])
+            return {'score': 0, 'sender': sender}
+        
+        def analyze_batch(self, emails, config):
+            self.batches.append([email['sender'] for email in emails])
+            return [{'score': 0, 'sender': email['sender']} for email in emails]
+    
+    def test_concurrent_requests_share_a_call(self):
+        """Test queued emails are sent in one batch"""
+        analyzer = self.FakeAnalyzer()
+        batcher = MicroBatcher(analyzer, {}, max_batch_size=3, max_wait=1)
+        futures = [batcher.submit(f'user{i}@example.com', 'Hi', 'Hello') for i in range(3)]
+        
+        results = [future.result(timeout=5) for future in futures]
+        
+        assert [r['sender'] for r in results] == [f'user{i}@example.com' for i in range(3)]
+        assert len(analyzer.batches) == 1
+
 class TestPatternMatcher:
     """Test pattern matching"""
     
@@ -68,6 +311,24 @@ class TestPatternMatcher:
         """Test suspicious phrase detection"""
         threats = matcher._check_body('Click here immediately to verify your account')
         assert len(threats) > 0
+    
+    def test_saturated_email_skips_remaining_checks(self, matcher, monkeypatch):
+        """Test checks stop once the pattern score is saturated"""
+        monkeypatch.setattr(matcher, '_check_grammar', lambda text: pytest.fail('grammar ran'))
+        urls = [f'http://192.168.0.{i}/amaz0n' for i in range(4)]
+        threats = matcher.check({'sender': 'a@b.com', 'subject': '', 'body': 'x', 'urls': urls})
+        assert len(threats) >= 7
+    
+    def test_suspicious_tld_checks_host_only(self, matcher):
+        """Test TLD check ignores look-alike paths"""
+        assert "Suspicious domain extension" in matcher._check_urls(['http://login.example.tk/'])
+        assert "Suspicious domain extension" not in matcher._check_urls(['https://example.com/page.html'])
+    
+    def test_overlapping_phrases_all_reported(self, matcher):
+        """Test phrases sharing words are each reported"""
+        threats = matcher._check_body('please verify your account will be closed')
+        assert "Suspicious phrase: 'verify your account'" in threats
+        assert "Suspicious phrase: 'your account will be'" in threats
 
 class TestURLValidator:
     """Test URL validation"""
@@ -81,6 +342,56 @@ class TestURLValidator:
         assert validator.is_suspicious('http://bit.ly/abc123')
         assert validator.is_suspicious('https://tinyurl.com/test')
     
+    def test_url_shortener_matches_host_only(self, validator):
+        """Test shorteners match whole host labels"""
+        assert validator._is_url_shortener('www.bit.ly')
+        assert validator._is_url_shortener('user@t.co:443')
+        assert not validator._is_url_shortener('microsoft.com')
+    
+    def test_homograph_detection(self, validator):
+        """Test lookalikes are caught but real subdomains are not"""
+        assert validator._has_homograph_attack('amaz0n.com')
+        assert validator._has_homograph_attack('paypa1.com')
+        assert validator._has_homograph_attack('rnicrosoft.com')
+        assert not validator._has_homograph_attack('www.amazon.de')
+    
+    def test_is_suspicious_batch(self, validator):
+        """Test batch verdicts match single URL checks"""
+        urls = ['https://bit.ly/abc', 'https://www.google.com', 'http://example.tk']
+        assert validator.is_suspicious_batch(urls) == [validator.is_suspicious(u) for u in urls]
+        assert validator.is_suspicious_batch([]) == []
+    
+    def test_domain_info_is_cached_copy(self, validator):
+        """Test domain info is memoized but callers get their own dict"""
+        info = validator.get_domain_info('https://bit.ly/abc')
+        assert info['is_shortened'] and info['is_https']
+        info['domain'] = 'changed'
+        assert validator.get_domain_info('https://bit.ly/abc')['domain'] == 'bit.ly'
+        
+        validator.clear_cache()
+        assert validator._domain_info_cached.cache_info().currsize == 0
+    
+    def test_clear_cache_applies_list_edits(self, validator):
+        """Test edited lists take effect after clear_cache"""
+        assert not validator.is_suspicious('https://evil.link/x')
+        assert not validator._has_homograph_attack('acrne.com')
+        
+        validator.url_shorteners.append('evil.link')
+        validator.legitimate_domains['acme'] = ['acme.com']
+        validator.clear_cache()
+        
+        assert validator.is_suspicious('https://evil.link/x')
+        assert validator._has_homograph_attack('acrne.com')
+        assert validator._has_subdomain_spoofing('acme.login.example.com')
+        assert not validator._has_homograph_attack('www.acme.com')
+    
+    def test_subdomain_spoofing(self, validator):
+        """Test brand names in subdomains of other domains"""
+        assert validator._has_subdomain_spoofing('paypal.login.example.com')
+        assert validator._has_subdomain_spoofing('secure-amazon.example.com')
+        assert not validator._has_subdomain_spoofing('smile.amazon.de')
+        assert not validator._has_subdomain_spoofing('signin.ebay.com')
+
     def test_ip_address_detection(self, validator):
         """Test IP address URL detection"""
         assert validator.is_suspicious('http://192.168.1.1/login')
@@ -110,6 +421,31 @@ class TestEmailParser:
         assert result['sender_email'] == 'john@example.com'
         assert result['sender_domain'] == 'example.com'
     
+    def test_parse_sender_quoted_display(self, parser):
+        """Test quoted display names are unquoted"""
+        result = parser._parse_sender('"Doe, John" <john@example.com>')
+        assert result['sender_display'] == 'Doe, John'
+        assert result['sender_email'] == 'john@example.com'
+        
+        # an address in the display name is still caught
+        result = parser._parse_sender('"security@paypal.com" <x@evil.com>')
+        assert result['sender_spoofed']
+    
+    def test_parse_sender_is_shared(self, parser):
+        """Test repeated senders reuse one parsed object"""
+        parsed = parser.parse('John Doe <john@example.com>', 'Hi', 'Hello')
+        assert parsed['sender_obj'] is parse_sender('John Doe <john@example.com>')
+        assert parsed['sender_obj'].domain == 'example.com'
+        assert parsed['sender_obj'].at_count == 1
+    
+    def test_reply_to_mismatch(self, parser):
+        """Test reply-to check compares address domains"""
+        headers = {'Reply-To': 'help@example.com'}
+        assert not parser.parse('Shop <news@example.com>', 'Hi', 'Hello', headers)['reply_to_mismatch']
+        headers = {'Reply-To': 'Help <help@other.net>'}
+        assert parser.parse('Shop <news@example.com>', 'Hi', 'Hello', headers)['reply_to_mismatch']
+        assert not parser.parse('news@example.com', 'Hi', 'Hello')['reply_to_mismatch']
+    
     def test_urgency_detection(self, parser):
         """Test urgency detection in parser"""
         urgent_text = "URGENT: Act now or your account expires immediately!"
@@ -124,6 +460,21 @@ class TestEmailParser:
         urls = parser._extract_urls(body)
         assert len(urls) == 2
 
+    def test_url_extraction_inside_href(self, parser):
+        """Test bare URLs inside an href value are still extracted"""
+        body = '<a href="http://ok.com/ http://192.168.0.1/x">link</a>'
+        urls = parser._extract_urls(body)
+        assert 'http://192.168.0.1/x' in urls
+        assert urls[0] == 'http://ok.com/ http://192.168.0.1/x'
+        
+        body = '<a href="https://bankexample.combit.ly\'>'
+        assert 'https://bankexample.combit.ly' in parser._extract_urls(body)
+    
+    def test_url_extraction_deduplicates(self, parser):
+        """Test repeated links are returned once, in order"""
+        body = 'http://b.example.com http://a.example.com http://b.example.com'
+        assert parser._extract_urls(body) == ['http://b.example.com', 'http://a.example.com']
+
 class TestRiskScorer:
     """Test risk scoring"""
     
@@ -141,6 +492,12 @@ class TestRiskScorer:
         )
         assert 0 <= score <= 100
     
+    def test_cheap_estimate(self, scorer):
+        """Test local-only estimate covers the full range"""
+        assert scorer.cheap_estimate(0, 0, {'sender': 'friend@gmail.com'}) == 0
+        parsed = {'sender': 'security-alert@amaz0n.tk', 'reply_to_mismatch': True}
+        assert scorer.cheap_estimate(10, 5, parsed) >= 90
+    
     def test_sender_trust(self, scorer):
         """Test sender trust scoring"""
         # trusted domain
@@ -150,6 +507,9 @@ class TestRiskScorer:
         # suspicious domain
         trust2 = scorer._calculate_sender_trust('alert@amaz0n-security.com')
         assert trust2 > 0
+        
+        # trusted name as a prefix of another domain
+        assert scorer._calculate_sender_trust('alert@amazon.com.example.ru') > 0
     
     def test_risk_factors(self, scorer):
         """Test risk factor generation"""
@@ -157,6 +517,57 @@ class TestRiskScorer:
         assert any('high' in f.lower() for f in factors)
         assert any('url' in f.lower() for f in factors)
 
+class TestReportGenerator:
+    """Test report generation"""
+    
+    def test_generate_multi_matches_generate(self):
+        """Test multi-format reports equal the single-format ones"""
+        reporter = ReportGenerator()
+        result = DetectionResult(score=85, risk_level='CRITICAL', threats=['<b>x</b>'],
+                                 suspicious_urls=['http://bit.ly/a'], analysis={'score': 85},
+                                 timestamp='2024-01-01T00:00:00', recommendations=['Delete it'])
+        reports = reporter.generate_multi(result, ('json', 'html', 'text'))
+        
+        for format, report in reports.items():
+            assert report == reporter.generate(result, format)
+        assert '&lt;b&gt;' in reports['html']
+
+class TestApp:
+    """Test web endpoints"""
+    
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+        import app
+        return app.app.test_client()
+    
+    def test_batch_stream_is_valid_json(self, client, monkeypatch):
+        """Test the streamed batch body stays valid JSON"""
+        import app
+        monkeypatch.setattr(app.detector.gpt_analyzer, 'client', fake_client(
+            '{"results": [{"index": 1, "score": 10, "threats": []}]}'))
+        monkeypatch.setitem(app.detector.config, 'gpt_short_circuit', {'enabled': False})
+        emails = [{'sender': 'friend@example.com', 'subject': 'Lunch', 'body': 'Noon?'},
+                  {'sender': None, 'subject': 'Hi', 'body': 'Hello'}]
+        
+        response = client.post('/batch', json={'emails': emails})
+        assert response.status_code == 200
+        assert len(json.loads(response.data)['results']) == 1
+        
+        # failures after the headers are sent still close the document
+        def fail(email_list):
+            yield from ()
+            raise RuntimeError('boom')
+        monkeypatch.setattr(app.detector, 'iter_batch_analyze', fail)
+        response = client.post('/batch', json={'emails': emails})
+        assert json.loads(response.data) == {'results': []}
+    
+    def test_batch_rejects_non_list(self, client):
+        """Test a malformed request fails before streaming starts"""
+        response = client.post('/batch', json={'emails': 'not a list'})
+        assert response.status_code == 400
+        assert 'error' in json.loads(response.data)
+
 class TestIntegration:
     """Integration tests"""
     
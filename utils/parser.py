@@ -8,44 +8,100 @@ import email
 from typing import Dict, List, Optional
 from datetime import datetime
 import base64
+from dataclasses import dataclass
+from email.utils import unquote
+from functools import lru_cache
+
+try:
+    import re2 as _engine  # linear-time matching for untrusted input
+except ImportError:
+    _engine = re
+
+@dataclass(frozen=True, slots=True)
+class ParsedSender:
+    """Sender address split into its parts"""
+    raw: str
+    lower: str
+    display: str
+    email: str
+    domain: str
+    at_count: int
+
+@lru_cache(maxsize=4096)
+def parse_sender(raw: str) -> ParsedSender:
+    """
+    Split sender into display name, address and domain
+    Returns shared ParsedSender, cached per raw string
+    """
+    if '<' in raw and '>' in raw:
+        display, _, rest = raw.partition('<')
+        display = unquote(display.strip())
+        email_addr = rest.partition('<')[0].partition('>')[0].strip()
+    else:
+        display = ''
+        email_addr = raw.strip()
+    
+    domain = email_addr.split('@')[-1] if '@' in email_addr else ''
+    
+    return ParsedSender(raw, raw.lower(), display, email_addr, domain, raw.count('@'))
 
 class EmailParser:
     """Parse and extract email components"""
     
+    # compiled once, shared by all parsers
+    _URL_RE = _engine.compile(r'https?://[^\s<>"{}|\\^`\[\]]+')
+    _HREF_OR_URL_RE = _engine.compile(r'(?i:href)=["\']([^"\']+)["\']|(' + _URL_RE.pattern + ')')
+    _URGENCY_RES = [_engine.compile(p) for p in (
+        r'urgent', r'immediate', r'expire', r'suspend',
+        r'act now', r'limit.*time', r'deadline', r'asap',
+        r'within \d+ (hours?|days?)', r'account.*lock'
+    )]
+    _ATTACHMENT_RES = [_engine.compile(r'filename="([^"]+)"'), _engine.compile(r'name="([^"]+)"')]
+    _FILE_RE = _engine.compile(r'([a-zA-Z0-9_-]+\.[a-zA-Z]{2,4})')
+    _EXTERNAL_IMG_RE = _engine.compile(r'(?i)<img[^>]+src=["\']https?://[^"\']+["\']')
+    
     def parse(self, sender: str, subject: str, body: str, 
              headers: Dict = None) -> Dict:
         """
         Parse email into structured format
         Returns parsed components
         """
+        # lowercased once, shared with the pattern matcher
+        subject_lower = subject.lower()
+        body_lower = body.lower()
+        
         parsed = {
             'sender': sender,
             'subject': subject,
             'body': body,
+            'subject_lower': subject_lower,
+            'body_lower': body_lower,
             'headers': headers or {},
-            'urls': self._extract_urls(body),
+            'urls': self._extract_urls(body, body_lower),
             'attachments': [],
             'timestamp': datetime.now().isoformat()
         }
         
         # extract sender components
+        sender_obj = parsed['sender_obj'] = parse_sender(sender)
         parsed.update(self._parse_sender(sender))
         
-        # extract metadata
+        # extract metadata and header-derived flags
         if headers:
             parsed.update(self._parse_headers(headers))
+            parsed['sent_at_odd_hour'] = self._check_odd_hour(headers.get('Date', ''))
+            parsed['reply_to_mismatch'] = self._check_reply_to(
+                headers.get('Reply-To', ''), sender_obj)
+        else:
+            parsed['sent_at_odd_hour'] = False
+            parsed['reply_to_mismatch'] = False
         
         # detect urgency
-        parsed['urgency_detected'] = self._detect_urgency(subject + ' ' + body)
+        parsed['urgency_detected'] = self._detect_urgency(
+            subject + ' ' + body, subject_lower + ' ' + body_lower)
         
         # extract attachments info
-        parsed['attachments'] = self._extract_attachments(body, headers)
-        
-        # check time anomalies
-        parsed['sent_at_odd_hour'] = self._check_odd_hour(headers)
-        
-        # reply-to check
-        parsed['reply_to_mismatch'] = self._check_reply_to(headers, sender)
+        parsed['attachments'] = self._extract_attachments(body, headers, body_lower)
         
         # count external images
         parsed['external_images_count'] = self._count_external_images(body)
@@ -54,25 +110,19 @@ class EmailParser:
     
     def _parse_sender(self, sender: str) -> Dict:
         """Parse sender address"""
-        result = {}
+        parts = parse_sender(sender)
+        result = {
+            'sender_display': parts.display,
+            'sender_email': parts.email,
+        }
         
-        # extract display name and email
-        if '<' in sender and '>' in sender:
-            display_name = sender.split('<')[0].strip()
-            email_addr = sender.split('<')[1].split('>')[0].strip()
-            result['sender_display'] = display_name
-            result['sender_email'] = email_addr
-            
-            # check for spoofing
-            if '@' in display_name:
-                result['sender_spoofed'] = True
-        else:
-            result['sender_email'] = sender.strip()
-            result['sender_display'] = ''
+        # check for spoofing
+        if '@' in parts.display:
+            result['sender_spoofed'] = True
         
         # extract domain
-        if '@' in result['sender_email']:
-            result['sender_domain'] = result['sender_email'].split('@')[-1]
+        if '@' in parts.email:
+            result['sender_domain'] = parts.domain
         
         return result
     
@@ -94,71 +144,98 @@ class EmailParser:
         
         return result
     
-    def _extract_urls(self, body: str) -> List[str]:
+    def _extract_urls(self, body: str, body_lower: str = None) -> List[str]:
         """Extract all URLs from body"""
-        urls = []
+        # every url, linked or bare, contains 'http'
+        if 'http' not in body:
+            return []
+        if body_lower is None:
+            body_lower = body.lower()
         
-        # standard urls
-        url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+'
-        urls.extend(re.findall(url_pattern, body))
+        if _engine is not re or len(body_lower) != len(body):
+            # re2 re-encodes the text on every match() call, and lowercasing
+            # may move offsets; either way use one pass of the combined regex
+            matches = self._HREF_OR_URL_RE.finditer(body)
+        else:
+            matches = self._scan_urls(body, body_lower)
         
-        # href urls
-        href_pattern = r'href=["\']([^"\']+)["\']'
-        hrefs = re.findall(href_pattern, body, re.IGNORECASE)
-        urls.extend([url for url in hrefs if url.startswith('http')])
+        urls = []
+        for match in matches:
+            href, url = match.groups()
+            if not href:
+                urls.append(url)
+                continue
+            if href.startswith('http'):
+                urls.append(href)
+            # bare urls inside the href value, a match hides them otherwise
+            urls.extend(self._URL_RE.findall(href))
         
-        # unique urls
-        return list(set(urls))
+        # unique urls, in order of appearance
+        return list(dict.fromkeys(urls))
     
-    def _detect_urgency(self, text: str) -> bool:
-        """Detect urgency indicators"""
-        urgency_patterns = [
-            r'urgent', r'immediate', r'expire', r'suspend',
-            r'act now', r'limit.*time', r'deadline', r'asap',
-            r'within \d+ (hours?|days?)', r'account.*lock'
-        ]
+    def _scan_urls(self, body: str, body_lower: str):
+        """
+        Find href values and bare urls, leftmost first
+        Yields matches like _HREF_OR_URL_RE.finditer
+        """
+        # str.find jumps between candidates; the regex only runs
+        # anchored at each one
+        match = self._HREF_OR_URL_RE.match
+        url_at = body.find('http')
+        href_at = body_lower.find('href=')
         
-        text_lower = text.lower()
+        while url_at >= 0:
+            start = href_at if 0 <= href_at < url_at else url_at
+            m = match(body, start)
+            if m:
+                yield m
+                pos = m.end()
+            else:
+                pos = start + 1
+            
+            if url_at < pos:
+                url_at = body.find('http', pos)
+            if 0 <= href_at < pos:
+                href_at = body_lower.find('href=', pos)
+    
+    def _detect_urgency(self, text: str, text_lower: str = None) -> bool:
+        """Detect urgency indicators"""
+        if text_lower is None:
+            text_lower = text.lower()
         urgency_count = 0
         
-        for pattern in urgency_patterns:
-            if re.search(pattern, text_lower):
+        for pattern in self._URGENCY_RES:
+            if pattern.search(text_lower):
                 urgency_count += 1
         
         return urgency_count >= 2
     
-    def _extract_attachments(self, body: str, headers: Dict) -> List[str]:
+    def _extract_attachments(self, body: str, headers: Dict,
+                             body_lower: str = None) -> List[str]:
         """Extract attachment information"""
         attachments = []
+        if body_lower is None:
+            body_lower = body.lower()
         
         # check content-type for attachments
         if headers:
             content_type = headers.get('Content-Type', '')
             if 'multipart' in content_type:
                 # simple attachment detection
-                attachment_patterns = [
-                    r'filename="([^"]+)"',
-                    r'name="([^"]+)"'
-                ]
-                for pattern in attachment_patterns:
-                    found = re.findall(pattern, str(headers))
+                for pattern in self._ATTACHMENT_RES:
+                    found = pattern.findall(str(headers))
                     attachments.extend(found)
         
         # check body for attachment references
-        if 'attachment' in body.lower():
+        if 'attachment' in body_lower:
             # extract mentioned files
-            file_pattern = r'([a-zA-Z0-9_-]+\.[a-zA-Z]{2,4})'
-            files = re.findall(file_pattern, body)
+            files = self._FILE_RE.findall(body)
             attachments.extend(files[:5])  # limit to 5
         
         return list(set(attachments))
     
-    def _check_odd_hour(self, headers: Dict) -> bool:
+    def _check_odd_hour(self, date_header: str) -> bool:
         """Check if sent at odd hour"""
-        if not headers:
-            return False
-        
-        date_header = headers.get('Date', '')
         if date_header:
             try:
                 # parse date
@@ -171,20 +248,14 @@ class EmailParser:
         
         return False
     
-    def _check_reply_to(self, headers: Dict, sender: str) -> bool:
+    def _check_reply_to(self, reply_to: str, sender: ParsedSender) -> bool:
         """Check reply-to mismatch"""
-        if not headers:
-            return False
-        
-        reply_to = headers.get('Reply-To', '').lower()
-        if reply_to and '@' in reply_to and '@' in sender:
-            sender_domain = sender.split('@')[-1].lower()
-            reply_domain = reply_to.split('@')[-1]
-            return sender_domain != reply_domain
+        if '@' in reply_to and sender.at_count:
+            # compare parsed domains so "Name <addr>" forms match
+            return sender.domain.lower() != parse_sender(reply_to).domain.lower()
         
         return False
     
     def _count_external_images(self, body: str) -> int:
         """Count external images"""
-        img_pattern = r'<img[^>]+src=["\']https?://[^"\']+["\']'
-        return len(re.findall(img_pattern, body, re.IGNORECASE))
\ No newline at end of file
+        return len(self._EXTERNAL_IMG_RE.findall(body))
\ No newline at end of file
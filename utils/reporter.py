@@ -3,11 +3,99 @@ Report Generator Module
 Creates formatted analysis reports
 """
 
-import json
+from collections import Counter
 from datetime import datetime
-from typing import Dict, Any
+from typing import IO, Any, Dict, Iterator
 import html
 
+import orjson
+
+def _dumps(obj: Any) -> str:
+    """Serialize obj as indented JSON text"""
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+
+_ESC = html.escape
+
+# risk level colors
+_COLOR_MAP = {
+    'LOW': '#28a745',
+    'MEDIUM': '#ffc107',
+    'HIGH': '#fd7e14',
+    'CRITICAL': '#dc3545'
+}
+
+# static pieces of the html report, filled in by _generate_html
+_HTML_HEAD = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Phishing Detection Report</title>
+    <style>
+        body { font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; }
+        .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 10px; }
+        .score { font-size: 48px; font-weight: bold; }
+        .risk-level { background: """
+
+_HTML_HEADER_OPEN = """; color: white; padding: 10px 20px; border-radius: 5px; display: inline-block; margin: 10px 0; }
+        .section { margin: 20px 0; padding: 15px; background: #f8f9fa; border-radius: 5px; }
+        .threat { background: #fff3cd; padding: 10px; margin: 5px 0; border-left: 4px solid #ffc107; }
+        .recommendation { background: #d1ecf1; padding: 10px; margin: 5px 0; border-left: 4px solid #17a2b8; }
+        .url { background: #f8d7da; padding: 10px; margin: 5px 0; border-left: 4px solid #dc3545; word-break: break-all; }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>🛡️ Phishing Detection Report</h1>
+        <div class="score">"""
+
+_HTML_THREATS_OPEN = """</p>
+    </div>
+    
+    <div class="section">
+        <h2>⚠️ Threats Detected ("""
+
+_HTML_URLS_OPEN = """
+    </div>
+    
+    <div class="section">
+        <h2>🔗 Suspicious URLs ("""
+
+_HTML_RECS_OPEN = """
+    </div>
+    
+    <div class="section">
+        <h2>💡 Recommendations</h2>
+        """
+
+_HTML_ANALYSIS_OPEN = """
+    </div>
+    
+    <div class="section">
+        <h2>📊 AI Analysis</h2>
+        <pre>"""
+
+_HTML_TAIL = """</pre>
+    </div>
+</body>
+</html>
+"""
+
+# batch summary, followed by one line per top threat
+_SUMMARY_HEADER = """
+BATCH ANALYSIS SUMMARY
+{rule}
+Total Emails Analyzed: {total}
+Average Risk Score: {avg_score:.1f}/100
+
+Risk Distribution:
+• CRITICAL: {critical} ({critical_pct:.1f}%)
+• HIGH: {high} ({high_pct:.1f}%)
+• MEDIUM: {medium} ({medium_pct:.1f}%)
+• LOW: {low} ({low_pct:.1f}%)
+
+Top Threats:
+"""
+
 class ReportGenerator:
     """Generate analysis reports in various formats"""
     
@@ -25,81 +113,89 @@ class ReportGenerator:
         else:
             return self._generate_json(result)
     
-    def _generate_json(self, result: Any) -> str:
-        """Generate JSON report"""
-        report = {
+    def generate_multi(self, result: Any, formats=('json', 'html')) -> Dict[str, str]:
+        """
+        Generate reports in several formats
+        Returns report by format, the analysis is serialized once
+        """
+        analysis_json = _dumps(result.analysis)
+        reports = {}
+        for format in formats:
+            if format == 'html':
+                reports[format] = ''.join(self._html_parts(result, analysis_json))
+            elif format == 'text':
+                reports[format] = self._generate_text(result, analysis_json)
+            else:
+                reports[format] = self._generate_json(result)
+        return reports
+    
+    def generate_stream(self, result: Any, fp: IO[str], format: str = 'json') -> None:
+        """
+        Write report in specified format to a text file object
+        HTML is written piece by piece; JSON and text are built whole
+        """
+        if format == 'html':
+            fp.writelines(self._html_parts(result))
+        elif format == 'text':
+            fp.write(self._generate_text(result))
+        else:
+            fp.write(_dumps(self._json_report(result)))
+    
+    def _json_report(self, result: Any) -> Dict:
+        """Collect JSON report fields"""
+        return {
             'timestamp': result.timestamp,
             'score': result.score,
             'risk_level': result.risk_level,
             'threats': result.threats,
             'suspicious_urls': result.suspicious_urls,
             'recommendations': result.recommendations,
-            'analysis': result.analysis
+            'analysis': result.analysis,
+            'truncated': result.truncated
         }
-        return json.dumps(report, indent=2)
+    
+    def _generate_json(self, result: Any) -> str:
+        """Generate JSON report"""
+        return _dumps(self._json_report(result))
     
     def _generate_html(self, result: Any) -> str:
         """Generate HTML report"""
-        # risk level colors
-        color_map = {
-            'LOW': '#28a745',
-            'MEDIUM': '#ffc107', 
-            'HIGH': '#fd7e14',
-            'CRITICAL': '#dc3545'
-        }
+        return ''.join(self._html_parts(result))
+    
+    def _html_parts(self, result: Any, analysis_json: str = None) -> Iterator[str]:
+        """Yield HTML report in pieces"""
+        esc = _ESC
+        if analysis_json is None:
+            analysis_json = _dumps(result.analysis)
         
-        color = color_map.get(result.risk_level, '#6c757d')
+        yield _HTML_HEAD
+        yield _COLOR_MAP.get(result.risk_level, '#6c757d')
+        yield _HTML_HEADER_OPEN
+        yield from (str(result.score), '/100</div>\n        <div class="risk-level">',
+                    result.risk_level, ' RISK</div>\n        <p>Generated: ',
+                    result.timestamp, _HTML_THREATS_OPEN,
+                    str(len(result.threats)), ')</h2>\n        ')
+        if result.threats:
+            yield from (f'<div class="threat">{esc(threat)}</div>' for threat in result.threats)
+        else:
+            yield '<p>No specific threats identified</p>'
         
-        html_report = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Phishing Detection Report</title>
-    <style>
-        body {{ font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; }}
-        .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 10px; }}
-        .score {{ font-size: 48px; font-weight: bold; }}
-        .risk-level {{ background: {color}; color: white; padding: 10px 20px; border-radius: 5px; display: inline-block; margin: 10px 0; }}
-        .section {{ margin: 20px 0; padding: 15px; background: #f8f9fa; border-radius: 5px; }}
-        .threat {{ background: #fff3cd; padding: 10px; margin: 5px 0; border-left: 4px solid #ffc107; }}
-        .recommendation {{ background: #d1ecf1; padding: 10px; margin: 5px 0; border-left: 4px solid #17a2b8; }}
-        .url {{ background: #f8d7da; padding: 10px; margin: 5px 0; border-left: 4px solid #dc3545; word-break: break-all; }}
-    </style>
-</head>
-<body>
-    <div class="header">
-        <h1>🛡️ Phishing Detection Report</h1>
-        <div class="score">{result.score}/100</div>
-        <div class="risk-level">{result.risk_level} RISK</div>
-        <p>Generated: {result.timestamp}</p>
-    </div>
-    
-    <div class="section">
-        <h2>⚠️ Threats Detected ({len(result.threats)})</h2>
-        {"".join(f'<div class="threat">{html.escape(threat)}</div>' for threat in result.threats) if result.threats else '<p>No specific threats identified</p>'}
-    </div>
-    
-    <div class="section">
-        <h2>🔗 Suspicious URLs ({len(result.suspicious_urls)})</h2>
-        {"".join(f'<div class="url">{html.escape(url)}</div>' for url in result.suspicious_urls) if result.suspicious_urls else '<p>No suspicious URLs found</p>'}
-    </div>
-    
-    <div class="section">
-        <h2>💡 Recommendations</h2>
-        {"".join(f'<div class="recommendation">{html.escape(rec)}</div>' for rec in result.recommendations)}
-    </div>
-    
-    <div class="section">
-        <h2>📊 AI Analysis</h2>
-        <pre>{json.dumps(result.analysis, indent=2)}</pre>
-    </div>
-</body>
-</html>
-"""
-        return html_report
+        yield from (_HTML_URLS_OPEN, str(len(result.suspicious_urls)), ')</h2>\n        ')
+        if result.suspicious_urls:
+            yield from (f'<div class="url">{esc(url)}</div>' for url in result.suspicious_urls)
+        else:
+            yield '<p>No suspicious URLs found</p>'
+        
+        yield _HTML_RECS_OPEN
+        yield from (f'<div class="recommendation">{esc(rec)}</div>' for rec in result.recommendations)
+        
+        # model output, keep it from closing the <pre>
+        yield from (_HTML_ANALYSIS_OPEN, esc(analysis_json, quote=False), _HTML_TAIL)
     
-    def _generate_text(self, result: Any) -> str:
+    def _generate_text(self, result: Any, analysis_json: str = None) -> str:
         """Generate text report"""
+        if analysis_json is None:
+            analysis_json = _dumps(result.analysis)
         lines = []
         lines.append("=" * 60)
         lines.append("PHISHING DETECTION REPORT")
@@ -135,7 +231,7 @@ class ReportGenerator:
         
         lines.append("AI ANALYSIS:")
         lines.append("-" * 40)
-        lines.append(json.dumps(result.analysis, indent=2))
+        lines.append(analysis_json)
         lines.append("=" * 60)
         
         return "\n".join(lines)
@@ -146,38 +242,31 @@ class ReportGenerator:
         if total == 0:
             return "No emails analyzed"
         
-        # calculate stats
-        critical = sum(1 for r in results if r.risk_level == 'CRITICAL')
-        high = sum(1 for r in results if r.risk_level == 'HIGH')
-        medium = sum(1 for r in results if r.risk_level == 'MEDIUM')
-        low = sum(1 for r in results if r.risk_level == 'LOW')
+        # calculate stats and count threat types in one pass
+        risk_count = Counter()
+        threat_count = Counter()
+        total_score = 0
+        for result in results:
+            risk_count[result.risk_level] += 1
+            total_score += result.score
+            threat_count.update(threat.split(':', 1)[0] for threat in result.threats)
         
-        avg_score = sum(r.score for r in results) / total
+        critical = risk_count['CRITICAL']
+        high = risk_count['HIGH']
+        medium = risk_count['MEDIUM']
+        low = risk_count['LOW']
         
-        summary = f"""
-BATCH ANALYSIS SUMMARY
-{'=' * 40}
-Total Emails Analyzed: {total}
-Average Risk Score: {avg_score:.1f}/100
-
-Risk Distribution:
-• CRITICAL: {critical} ({critical/total*100:.1f}%)
-• HIGH: {high} ({high/total*100:.1f}%)
-• MEDIUM: {medium} ({medium/total*100:.1f}%)
-• LOW: {low} ({low/total*100:.1f}%)
-
-Top Threats:
-"""
-        # count threat frequency
-        threat_count = {}
-        for result in results:
-            for threat in result.threats:
-                threat_type = threat.split(':')[0]
-                threat_count[threat_type] = threat_count.get(threat_type, 0) + 1
+        avg_score = total_score / total
+        
+        summary = [_SUMMARY_HEADER.format(
+            rule='=' * 40, total=total, avg_score=avg_score,
+            critical=critical, critical_pct=critical / total * 100,
+            high=high, high_pct=high / total * 100,
+            medium=medium, medium_pct=medium / total * 100,
+            low=low, low_pct=low / total * 100)]
         
         # top threats
-        top_threats = sorted(threat_count.items(), key=lambda x: x[1], reverse=True)[:5]
-        for threat, count in top_threats:
-            summary += f"• {threat}: {count} occurrences\n"
+        summary.extend(f"• {threat}: {count} occurrences\n"
+                       for threat, count in threat_count.most_common(5))
         
-        return summary
\ No newline at end of file
+        return ''.join(summary)
\ No newline at end of file
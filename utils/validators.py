@@ -4,13 +4,74 @@ Validates and checks URLs for suspicious patterns
 """
 
 import re
+from functools import lru_cache
+from itertools import product
 from urllib.parse import urlparse, unquote
 from typing import List, Tuple, Optional
 import ipaddress
 
+try:
+    import re2 as _engine  # linear-time matching for untrusted input
+except ImportError:
+    _engine = re
+
+# legitimate domains (for spoofing check)
+_LEGIT_DOMAINS = {
+    'amazon': ['amazon.com', 'amazon.co.uk', 'amazon.de'],
+    'paypal': ['paypal.com', 'paypal.me'],
+    'microsoft': ['microsoft.com', 'outlook.com', 'live.com'],
+    'google': ['google.com', 'gmail.com', 'googleapis.com'],
+    'apple': ['apple.com', 'icloud.com'],
+    'facebook': ['facebook.com', 'fb.com'],
+    'twitter': ['twitter.com', 'x.com'],
+    'linkedin': ['linkedin.com', 'lnkd.in'],
+    'netflix': ['netflix.com'],
+    'ebay': ['ebay.com']
+}
+
+# common substitutions
+_SUBSTITUTIONS = (
+    ('0', 'o'), ('o', '0'),
+    ('1', 'l'), ('l', '1'), ('1', 'i'),
+    ('rn', 'm'), ('vv', 'w')
+)
+
+def _lookalikes(label: str, old: str, new: str) -> set:
+    """
+    Find labels that become label when old is replaced by new
+    Returns set of lookalike labels
+    """
+    pieces = label.split(new)
+    variants = set()
+    # each occurrence of new may have been written as old
+    for joins in product((new, old), repeat=len(pieces) - 1):
+        candidate = pieces[0] + ''.join(j + p for j, p in zip(joins, pieces[1:]))
+        if candidate.replace(old, new) == label:
+            variants.add(candidate)
+    return variants
+
+def _build_homograph_index(legitimate_domains: dict, substitutions) -> dict:
+    """
+    Map every label that reads as a legitimate main label after a substitution
+    Returns dict of lookalike label to legitimate label
+    """
+    index = {}
+    for domains in legitimate_domains.values():
+        for legit in domains:
+            legit_main = legit.split('.')[-2]
+            for old, new in substitutions:
+                for variant in _lookalikes(legit_main, old, new):
+                    index.setdefault(variant, legit_main)
+    return index
+
+# built once at import for the default lists
+_HOMOGRAPH_INDEX = _build_homograph_index(_LEGIT_DOMAINS, _SUBSTITUTIONS)
+
 class URLValidator:
     """URL validation and analysis"""
     
+    REDIRECT_PARAMS = ('url=', 'redirect=', 'goto=', 'dest=', 'target=')
+    
     def __init__(self):
         # known url shorteners
         self.url_shorteners = [
@@ -26,178 +87,245 @@ class URLValidator:
         ]
         
         # legitimate domains (for spoofing check)
-        self.legitimate_domains = {
-            'amazon': ['amazon.com', 'amazon.co.uk', 'amazon.de'],
-            'paypal': ['paypal.com', 'paypal.me'],
-            'microsoft': ['microsoft.com', 'outlook.com', 'live.com'],
-            'google': ['google.com', 'gmail.com', 'googleapis.com'],
-            'apple': ['apple.com', 'icloud.com'],
-            'facebook': ['facebook.com', 'fb.com'],
-            'twitter': ['twitter.com', 'x.com'],
-            'linkedin': ['linkedin.com', 'lnkd.in'],
-            'netflix': ['netflix.com'],
-            'ebay': ['ebay.com']
-        }
+        self.legitimate_domains = {company: list(domains)
+                                   for company, domains in _LEGIT_DOMAINS.items()}
+        
+        # common substitutions
+        self.substitutions = list(_SUBSTITUTIONS)
+        
+        # lookup tables derived from the lists above
+        self._rebuild()
+        
+        # suspicious path patterns, one alternation searched once
+        suspicious_paths = [
+            r'/[a-f0-9]{32}',  # md5 hash
+            r'/verify/[a-z0-9]+/account',
+            r'/security/[a-z0-9]+/update',
+            r'\.php\?[a-z]+=[a-z0-9]+(?:&[a-z]+=[a-z0-9]+){2,}',
+            r'/\.\./\.\.',  # directory traversal
+        ]
+        self._susp_path_re = _engine.compile('|'.join(f'(?:{p})' for p in suspicious_paths))
+        
+        # memoize verdicts, the same links recur across emails
+        self._is_suspicious_cached = lru_cache(maxsize=100_000)(self._check_url)
+        # one parse per url, shared by is_suspicious and get_domain_info
+        self._parse = lru_cache(maxsize=4096)(self._parse_url)
+        self._domain_info_cached = lru_cache(maxsize=8192)(self._domain_info)
+    
+    def _rebuild(self):
+        """Derive the lookup tables from the public lists"""
+        # exact hosts and subdomain suffixes, not substrings
+        self._shorteners = frozenset(self.url_shorteners)
+        self._shortener_suffixes = tuple('.' + s for s in self.url_shorteners)
+        self._susp_tlds = tuple(self.suspicious_tlds)
+        
+        # main label of each legitimate domain, e.g. amazon.co.uk -> co
+        self._legit_mains = {legit: legit.split('.')[-2]
+                             for domains in self.legitimate_domains.values()
+                             for legit in domains}
+        self._legit_labels = tuple(dict.fromkeys(self._legit_mains.values()))
+        self._legit_hosts = frozenset(self._legit_mains)
+        self._legit_suffixes = tuple('.' + legit for legit in self._legit_mains)
+        # company -> its domains, as sets for the subdomain spoofing check
+        self._company_domains = {company: frozenset(domains)
+                                 for company, domains in self.legitimate_domains.items()}
+        
+        # lookalike labels; the import-time index serves the default lists
+        if (self.legitimate_domains == _LEGIT_DOMAINS
+                and self.substitutions == list(_SUBSTITUTIONS)):
+            self._homograph_index = _HOMOGRAPH_INDEX
+        else:
+            self._homograph_index = _build_homograph_index(
+                self.legitimate_domains, self.substitutions)
     
     def is_suspicious(self, url: str) -> bool:
         """
         Check if URL is suspicious
         Returns True if suspicious
         """
+        return self._is_suspicious_cached(url)
+    
+    def is_suspicious_batch(self, urls: List[str]) -> List[bool]:
+        """
+        Check many URLs at once
+        Returns one verdict per URL, in order
+        """
+        # repeats across a batch are served from the verdict cache
+        return list(map(self._is_suspicious_cached, urls))
+    
+    def _parse_url(self, url: str) -> Tuple[str, str, str, str, str]:
+        """
+        Decode and split URL
+        Returns (decoded url, netloc, path, scheme, query), lowercased
+        """
+        # decode url
+        url = unquote(url)
+        parsed = urlparse(url.lower())
+        return url, parsed.netloc, parsed.path, parsed.scheme, parsed.query
+    
+    def _check_url(self, url: str) -> bool:
+        """Run all URL checks"""
         try:
-            # decode url
-            url = unquote(url)
-            parsed = urlparse(url.lower())
+            url, netloc, path, _, _ = self._parse(url)
+            # split the netloc once, shared by the host checks
+            host = self._host(netloc)
+            parts = netloc.split('.')
             
-            # check various indicators
-            checks = [
-                self._is_url_shortener(parsed.netloc),
-                self._has_suspicious_tld(parsed.netloc),
-                self._is_ip_address(parsed.netloc),
-                self._has_homograph_attack(parsed.netloc),
-                self._has_subdomain_spoofing(parsed.netloc),
-                self._has_suspicious_path(parsed.path),
-                self._has_multiple_redirects(url)
-            ]
-            
-            return any(checks)
+            # check various indicators, cheapest first; stop at the first hit
+            return (self._is_url_shortener(netloc, host)
+                    or self._has_suspicious_tld(netloc, host)
+                    or self._is_ip_address(netloc)
+                    or self._has_suspicious_path(path)
+                    or self._has_multiple_redirects(url)
+                    or self._has_subdomain_spoofing(netloc, parts)
+                    or self._has_homograph_attack(netloc, host, parts))
             
         except Exception:
             # error parsing = suspicious
             return True
     
-    def _is_url_shortener(self, domain: str) -> bool:
+    def _is_url_shortener(self, domain: str, host: str = None) -> bool:
         """Check if domain is url shortener"""
-        return any(shortener in domain for shortener in self.url_shorteners)
+        if host is None:
+            host = self._host(domain)
+        return host in self._shorteners or host.endswith(self._shortener_suffixes)
     
-    def _has_suspicious_tld(self, domain: str) -> bool:
+    def _has_suspicious_tld(self, domain: str, host: str = None) -> bool:
         """Check for suspicious TLD"""
-        return any(domain.endswith(tld) for tld in self.suspicious_tlds)
+        if host is None:
+            host = self._host(domain)
+        return host.endswith(self._susp_tlds)
+    
+    @staticmethod
+    def _host(domain: str) -> str:
+        """Strip userinfo and port from netloc"""
+        return domain.rpartition('@')[2].partition(':')[0]
     
     def _is_ip_address(self, domain: str) -> bool:
         """Check if domain is IP address"""
         # remove port if present
         domain = domain.split(':')[0]
+        # only digits and dots can parse, skip the exception otherwise
+        if not domain.replace('.', '').isdigit():
+            return False
         try:
             ipaddress.ip_address(domain)
             return True
         except ValueError:
             return False
     
-    def _has_homograph_attack(self, domain: str) -> bool:
+    def _has_homograph_attack(self, domain: str, host: str = None,
+                              domain_parts: List[str] = None) -> bool:
         """Check for homograph attacks"""
-        # common substitutions
-        substitutions = [
-            ('0', 'o'), ('o', '0'),
-            ('1', 'l'), ('l', '1'), ('1', 'i'),
-            ('rn', 'm'), ('vv', 'w')
-        ]
-        
-        # check each legitimate domain
-        for company, legit_domains in self.legitimate_domains.items():
-            for legit in legit_domains:
-                # check if similar to legitimate
-                if self._is_similar_domain(domain, legit, substitutions):
-                    return True
-        
-        return False
-    
-    def _is_similar_domain(self, domain: str, legitimate: str, 
-                          substitutions: List[Tuple]) -> bool:
-        """Check if domain is similar to legitimate"""
-        # exact match is ok
-        if domain == legitimate:
+        # the real sites and their subdomains are fine
+        if host is None:
+            host = self._host(domain)
+        if host in self._legit_hosts or host.endswith(self._legit_suffixes):
             return False
         
         # remove subdomains for comparison
-        domain_parts = domain.split('.')
-        legit_parts = legitimate.split('.')
+        if domain_parts is None:
+            domain_parts = domain.split('.')
+        if len(domain_parts) < 2:
+            return False
+        domain_main = domain_parts[-2]
         
-        if len(domain_parts) >= 2 and len(legit_parts) >= 2:
-            domain_main = domain_parts[-2]
-            legit_main = legit_parts[-2]
-            
-            # check with substitutions
-            for old, new in substitutions:
-                test_domain = domain_main.replace(old, new)
-                if test_domain == legit_main:
-                    return True
-            
-            # check typosquatting (1 char difference)
-            if self._levenshtein_distance(domain_main, legit_main) == 1:
+        # check with substitutions
+        if domain_main in self._homograph_index:
+            return True
+        
+        # check typosquatting (1 char difference)
+        for legit_main in self._legit_labels:
+            if domain_main != legit_main and self._is_edit_distance_le1(domain_main, legit_main):
                 return True
         
         return False
     
-    def _levenshtein_distance(self, s1: str, s2: str) -> int:
-        """Calculate edit distance between strings"""
+    @staticmethod
+    def _is_edit_distance_le1(s1: str, s2: str) -> bool:
+        """
+        Check if strings are at most one edit apart
+        Returns True for one insertion, deletion or substitution
+        """
         if len(s1) < len(s2):
-            return self._levenshtein_distance(s2, s1)
-        
-        if len(s2) == 0:
-            return len(s1)
+            s1, s2 = s2, s1
+        if len(s1) - len(s2) > 1:
+            return False
         
-        previous_row = range(len(s2) + 1)
-        for i, c1 in enumerate(s1):
-            current_row = [i + 1]
-            for j, c2 in enumerate(s2):
-                insertions = previous_row[j + 1] + 1
-                deletions = current_row[j] + 1
-                substitutions = previous_row[j] + (c1 != c2)
-                current_row.append(min(insertions, deletions, substitutions))
-            previous_row = current_row
+        # skip the common prefix, the rest must match after one edit
+        i = 0
+        for c1, c2 in zip(s1, s2):
+            if c1 != c2:
+                break
+            i += 1
+        else:
+            return True
         
-        return previous_row[-1]
+        if len(s1) == len(s2):
+            return s1[i + 1:] == s2[i + 1:]  # substitution
+        return s1[i + 1:] == s2[i:]  # deletion from the longer one
     
-    def _has_subdomain_spoofing(self, domain: str) -> bool:
+    def _has_subdomain_spoofing(self, domain: str, parts: List[str] = None) -> bool:
         """Check for subdomain spoofing"""
         # look for legitimate domains in subdomains
-        parts = domain.split('.')
+        if parts is None:
+            parts = domain.split('.')
         if len(parts) > 2:
             subdomains = '.'.join(parts[:-2])
-            for company in self.legitimate_domains:
-                if company in subdomains:
-                    # check if actual domain is not legitimate
-                    main_domain = '.'.join(parts[-2:])
-                    if main_domain not in self.legitimate_domains[company]:
-                        return True
+            main_domain = '.'.join(parts[-2:])
+            for company, domains in self._company_domains.items():
+                # company name in subdomains, actual domain not legitimate
+                if company in subdomains and main_domain not in domains:
+                    return True
         return False
     
     def _has_suspicious_path(self, path: str) -> bool:
         """Check for suspicious path patterns"""
-        suspicious_patterns = [
-            r'/[a-f0-9]{32}',  # md5 hash
-            r'/verify/[a-z0-9]+/account',
-            r'/security/[a-z0-9]+/update',
-            r'\.php\?[a-z]+=[a-z0-9]+(&[a-z]+=[a-z0-9]+){2,}',
-            r'/\.\./\.\.',  # directory traversal
-        ]
-        
-        for pattern in suspicious_patterns:
-            if re.search(pattern, path.lower()):
-                return True
-        
-        return False
+        path = path.lower()
+        # every pattern needs one of these literals or a 32 char hash
+        if len(path) < 33 and not ('/verify/' in path or '/security/' in path
+                                   or '.php?' in path or '/../' in path):
+            return False
+        return self._susp_path_re.search(path) is not None
     
     def _has_multiple_redirects(self, url: str) -> bool:
         """Check for multiple redirects"""
-        # count redirect parameters
-        redirect_params = ['url=', 'redirect=', 'goto=', 'dest=', 'target=']
-        count = sum(param in url.lower() for param in redirect_params)
-        return count >= 2
+        # count redirect parameters, stop at the second
+        url = url.lower()
+        count = 0
+        for param in self.REDIRECT_PARAMS:
+            if param in url:
+                count += 1
+                if count >= 2:
+                    return True
+        return False
+    
+    def clear_cache(self):
+        """
+        Drop memoized results and rebuild the lookup tables
+        Call after editing the shortener, TLD, domain or substitution lists
+        """
+        self._rebuild()
+        self._is_suspicious_cached.cache_clear()
+        self._parse.cache_clear()
+        self._domain_info_cached.cache_clear()
     
     def get_domain_info(self, url: str) -> dict:
         """Get detailed domain information"""
+        # copy, callers may modify the result
+        return dict(self._domain_info_cached(url))
+    
+    def _domain_info(self, url: str) -> dict:
+        """Collect domain information"""
         try:
-            parsed = urlparse(url)
-            domain = parsed.netloc.lower()
+            _, domain, path, scheme, query = self._parse(url)
             
             return {
                 'domain': domain,
-                'is_https': parsed.scheme == 'https',
+                'is_https': scheme == 'https',
                 'has_port': ':' in domain,
-                'path_depth': len([p for p in parsed.path.split('/') if p]),
-                'has_query': bool(parsed.query),
+                'path_depth': len([p for p in path.split('/') if p]),
+                'has_query': bool(query),
                 'is_shortened': self._is_url_shortener(domain),
                 'is_ip': self._is_ip_address(domain)
             }